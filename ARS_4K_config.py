@@ -0,0 +1,195 @@
+# Configuration of the logger: any number of cryostats, each with its own instruments,
+# sample rates, log directory and Overseer bot identity. See ars_logger.example.yaml.
+# Without a config file a single cryostat with the classic setup is used
+# (LakeShore 335 on GPIB 12, VSM77 pressure gauge, Logs/ in the working directory).
+import copy
+from os import path
+
+import yaml
+
+from Storage.recording import RECORDING_MODES, RECORD_DEADBAND
+
+# Defaults of a process
+PROCESS_DEFAULTS = {
+    'metrics_port': 9337,  # local HTTP port of the /metrics endpoint (Prometheus format), null - disabled
+    'log_flush_records': 10,  # flush log files every N records...
+    'log_flush_interval': 300,  # ...or every T seconds
+    # records are first appended to a write-ahead spool in this directory (must be on a local disk),
+    # records not written to logs are replayed at start (see Storage/spool.py); null - no spool
+    'spool_dir': 'Spool',
+    'spool_fsync': False,  # fsync the spool on every record, survives a power loss
+    # SQLite archives of cryostats, <archive_dir>/<cryostat name>.sqlite; must be on a local disk,
+    # SQLite in WAL mode does not work on network file systems (logs_dir may be a share)
+    'archive_dir': 'Archive',
+}
+
+# Defaults of a cryostat
+CRYOSTAT_DEFAULTS = {
+    'name': 'ARS',
+    'logs_dir': 'Logs',
+    'log_period': 30,  # seconds between log records
+    # log file format: 'text' - HH-MM-SS lines, 'binary' - columnar float64 files (see Storage/binary_log.py), 'both'
+    'log_format': 'text',
+    'archive': True,  # keep an SQLite archive of all samples in archive_dir (see Storage/archive.py)
+    # which samples are written: 'interval' - the latest one every log_period, 'all' - every sample,
+    # 'deadband' - only samples needed to reconstruct the data within a deviation (set per instrument) plus
+    # a record every heartbeat seconds (see Storage/recording.py)
+    'recording': {'mode': 'interval', 'heartbeat': 300},
+    'reconnect_period': 30,  # seconds between attempts to connect a lost device
+    'buffer_capacity': 24 * 3600,  # samples kept in memory, a day at 1 Hz
+    'trend_windows': [60, 600, 3600],  # seconds; the shortest one gives warming/cooling status
+    'bot': {'host': 'triangle.enricherclub.com', 'port': 23137, 'auth_file': 'overseer_auth.dat'},
+    'instruments': [
+        {'type': 'lakeshore335', 'name': 'temperature', 'address': 12, 'channels': ['A', 'B']},
+        {'type': 'vsm', 'name': 'pressure', 'device_num': 1},
+    ],
+}
+
+# Defaults of instruments by type
+INSTRUMENT_DEFAULTS = {
+    'lakeshore335': {'sample_period': 1, 'timeout': 10, 'channels': ['A', 'B'], 'labels': None,
+                     'heater_channel': 1, 'log_name': 'Temperature', 'recording': None},
+    'vsm': {'sample_period': 1, 'timeout': 2, 'device_num': 1, 'port': None, 'log_name': 'Pressure',
+            'recording': None},
+}
+
+# Labels of channels of instruments without configurable channels
+FIXED_LABELS = {
+    'vsm': ['P'],
+}
+
+# Default deadband deviations of instruments by type: K, mbar
+DEFAULT_DEVIATIONS = {
+    'lakeshore335': 0.001,
+    'vsm': 1e-7,
+}
+
+
+# An invalid configuration
+class ConfigError(ValueError):
+    pass
+
+
+def _with_defaults(defaults, values):
+    res = copy.deepcopy(defaults)
+    res.update(values or {})
+    return res
+
+
+# value, value2, value3...
+def _numbered(value, n):
+    return value if n == 1 else f'{value}{n}'
+
+
+# The first of value, value2, value3... not in taken
+def _unique_default(value, taken):
+    n = 1
+    while _numbered(value, n) in taken:
+        n += 1
+    return _numbered(value, n)
+
+
+# taken - {'name': set, 'log_name': set, 'labels': set} of instruments checked before in this cryostat
+def _check_instrument(cryostat, instrument, taken):
+    cryostat_name = cryostat['name']
+    if instrument.get('type') not in INSTRUMENT_DEFAULTS:
+        raise ConfigError(f'{cryostat_name}: unknown instrument type {instrument.get("type")}')
+    res = _with_defaults(INSTRUMENT_DEFAULTS[instrument['type']], instrument)
+    # names, log files and channel labels must not clash: they key scheduler tasks, log files and the status,
+    # defaults of a second instrument of a type get a number (lakeshore3352, Temperature2, A2...)
+    for key in ('name', 'log_name'):
+        if key not in instrument or instrument[key] is None:
+            res[key] = _unique_default(res['type'] if key == 'name' else res[key], taken[key])
+        elif res[key] in taken[key]:
+            raise ConfigError(f'{cryostat_name}: duplicate instrument {key} {res[key]}')
+        taken[key].add(res[key])
+    # a recording policy of an instrument overrides the one of a cryostat,
+    # a deviation of the instrument type is used only if neither of them sets one
+    recording = dict(cryostat['recording'])
+    recording.setdefault('deviation', DEFAULT_DEVIATIONS[res['type']])
+    res['recording'] = _with_defaults(recording, res['recording'])
+    if res['recording']['mode'] not in RECORDING_MODES:
+        raise ConfigError(f'{cryostat_name}: unknown recording mode {res["recording"]["mode"]}')
+    if res['type'] == 'lakeshore335':
+        if res['labels'] is None:
+            channels = [str(chan) for chan in res['channels']]
+            n = 1
+            while any(_numbered(chan, n) in taken['labels'] for chan in channels):
+                n += 1
+            res['labels'] = [_numbered(chan, n) for chan in channels]
+        if len(res['labels']) != len(res['channels']):
+            raise ConfigError(f'{cryostat_name}: number of labels and channels of {res["name"]} differ')
+        labels = set(res['labels'])
+        if len(labels) != len(res['labels']) or labels & taken['labels']:
+            raise ConfigError(f'{cryostat_name}: duplicate channel labels of {res["name"]}')
+        taken['labels'] |= labels
+    if res['type'] == 'lakeshore335' and res.get('address') is None:
+        raise ConfigError(f'{cryostat_name}: GPIB address of {res["name"]} is not set')
+    if res['recording']['mode'] == RECORD_DEADBAND:
+        _check_deviations(cryostat_name, res, instrument)
+    return res
+
+
+# A per-channel deviation {key: number} is keyed by a label or a channel of an instrument (e.g. A2 or A
+# of a second controller), converts it to {label: number}. A dict of a cryostat may lack channels of some
+# instruments, type defaults are used for them
+def _check_deviations(cryostat_name, res, instrument):
+    deviation = res['recording']['deviation']
+    if not isinstance(deviation, dict):
+        return
+    own = 'deviation' in (instrument.get('recording') or {})
+    if res['type'] in FIXED_LABELS:
+        channels = labels = FIXED_LABELS[res['type']]
+    else:
+        channels, labels = [str(chan) for chan in res['channels']], res['labels']
+    if own:
+        unknown = set(deviation) - set(channels) - set(labels)
+        if unknown:
+            raise ConfigError(f'{cryostat_name}: deviations of unknown channels {sorted(unknown)} of {res["name"]}')
+    by_label = {}
+    for chan, label in zip(channels, labels):
+        if label in deviation:
+            by_label[label] = deviation[label]
+        elif chan in deviation:
+            by_label[label] = deviation[chan]
+        elif not own:
+            by_label[label] = DEFAULT_DEVIATIONS[res['type']]
+        else:
+            raise ConfigError(f'{cryostat_name}: deviation of channel {label} of {res["name"]} is not set')
+    res['recording']['deviation'] = by_label
+
+
+# Logs directories of cryostats must be different and not nested: files are dispatched to a cryostat by path
+def _check_logs_dirs(cryostats):
+    dirs = [(cryostat['name'], path.abspath(cryostat['logs_dir'])) for cryostat in cryostats]
+    for i, (name1, dir1) in enumerate(dirs):
+        for name2, dir2 in dirs[i + 1:]:
+            if path.commonpath([dir1, dir2]) in (dir1, dir2):
+                raise ConfigError(f'Logs directories of {name1} and {name2} must not be the same or nested')
+
+
+# Fills in defaults and checks a configuration dict, returns a new dict
+def normalize_config(config):
+    res = _with_defaults(PROCESS_DEFAULTS, {k: v for k, v in (config or {}).items() if k != 'cryostats'})
+    cryostats = (config or {}).get('cryostats') or [{}]
+    res['cryostats'] = []
+    names = set()
+    for cryostat in cryostats:
+        cryostat = _with_defaults(CRYOSTAT_DEFAULTS, cryostat)
+        cryostat['bot'] = _with_defaults(CRYOSTAT_DEFAULTS['bot'], cryostat.get('bot'))
+        cryostat['recording'] = _with_defaults(CRYOSTAT_DEFAULTS['recording'], cryostat.get('recording'))
+        if cryostat['name'] in names:
+            raise ConfigError(f'Duplicate cryostat name: {cryostat["name"]}')
+        names.add(cryostat['name'])
+        taken = {'name': set(), 'log_name': set(), 'labels': set()}
+        cryostat['instruments'] = [_check_instrument(cryostat, i, taken) for i in cryostat['instruments']]
+        res['cryostats'].append(cryostat)
+    _check_logs_dirs(res['cryostats'])
+    return res
+
+
+def load_config(file_path=None):
+    if file_path is None:
+        return normalize_config({})
+    with open(file_path, 'r') as f:
+        return normalize_config(yaml.safe_load(f))
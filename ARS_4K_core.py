@@ -0,0 +1,414 @@
+# Acquisition core of the ARS 4K cryostat logger: instrument polling, logs, status for the Overseer bot.
+# Importing this module has no side effects and does not need wx.
+# Run headless (e.g. as a daemon on a machine without a display):
+#   python ARS_4K_core.py --headless [--config ars_logger.yaml]
+# Without --headless the tray icon frontend (ARS_4K_tray.py) is loaded.
+import argparse
+import os
+from os import path
+import signal
+import threading
+import time
+
+from ARS_4K_config import load_config
+from Drivers.LakeShore335 import LakeShore335
+from Drivers.ThyracontVSM import ThyracontVSM
+from Acquisition.scheduler import AcquisitionScheduler, AcquisitionTask, FunctionTask
+from Acquisition.ring_buffer import SampleRingBuffer
+from Acquisition.trend import TrendEstimator
+from Acquisition.status import StatusPublisher
+from Acquisition.alerts import AlertMonitor
+from Storage.log_writer import LogWriter, FSYNC_BATCH
+from Storage.log_index import LogIndex
+from Storage.archive import SampleArchive
+from Storage.day_directories import DayDirectories
+from Storage.recording import make_recorder
+from Storage.spool import WriteAheadSpool
+from Storage.rollups import RollupAggregator, rollup_columns, rollup_file_name
+from Instrumentation.metrics_server import MetricsServer
+
+temp_channels = ('A', 'B')
+
+
+# The latest sample of a task as (timestamp, values), None if the last read failed or the sample is older
+# than 2 sample periods: a buffered value of a lost device must not be logged or shown as current
+def fresh_sample(task, now):
+    latest = task.buffer.latest()
+    if latest is None or task.failed or now - latest[0] > 2 * task.period:
+        return None
+    return latest
+
+
+# Raises an exception on a failed read (unlike GetTemperatures returning zeros)
+def scan_temperatures(device: LakeShore335, channels=temp_channels):
+    return tuple(device.ReadTemperatures(channels))
+
+
+def get_bot_login_password(auth_file_name='overseer_auth.dat'):
+    try:
+        with open(auth_file_name, 'r') as f:
+            for i, line in enumerate(f):
+                if i == 0:
+                    login = line.strip()
+                elif i == 1:
+                    password = line.strip()
+        return login, password
+    except Exception:
+        print(f'Cannot authorize in Overseer bot, invalid credentials file {auth_file_name}')
+        return "", ""
+
+
+class TemperatureTask(AcquisitionTask):
+    def __init__(self, logger, config):
+        super().__init__(f'{logger.name}/{config["name"]}', config['sample_period'], timeout=config['timeout'],
+                         reconnect_period=logger.config['reconnect_period'])
+        self.logger = logger
+        self.config = config
+        self.channels = tuple(config['channels'])
+        self.labels = tuple(config['labels'])
+        self.log_name = config['log_name']
+        self.buffer = SampleRingBuffer(self.labels, logger.config['buffer_capacity'])
+        self.trend = TrendEstimator(tuple(logger.config['trend_windows']))
+        self.rollups = RollupAggregator(self.labels, logger.rollup_sink(self.log_name, self.labels))
+        self.recorder = make_recorder(config['recording'], self.labels)
+        self.device = None
+        self.failed = False  # the last read failed, the buffered sample is not current
+
+    def connect(self):
+        self.device = LakeShore335(device_num=self.config['address'], control_channel=self.channels[0],
+                                   heater_channel=self.config['heater_channel'], mode='passive')
+
+    def disconnect(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    # A failed read reopens the VISA session (shared by all drivers of the address) and is tried once more,
+    # if it fails again the scheduler disconnects the device and connects it later
+    def read(self):
+        try:
+            return scan_temperatures(self.device, self.channels)
+        except Exception as e:
+            print(f'{self.name}: {e}, reopening VISA session')
+            self.device.reconnect()
+            return scan_temperatures(self.device, self.channels)
+
+    def on_sample(self, timestamp, value):
+        self.failed = False
+        self.buffer.append(timestamp, value)
+        self.trend.add(timestamp, value[0])
+        self.logger.publish_status(timestamp)
+        for label, temp in zip(self.labels, value):
+            self.logger.alerts.temperature_sample(f'Channel {label}', timestamp, temp)
+        self.rollups.add(timestamp, value)
+        if self.recorder is not None:
+            self.logger.record(self, self.recorder.add(timestamp, value))
+
+    def on_error(self, exc):
+        super().on_error(exc)
+        self.failed = True
+        now = time.time()
+        self.logger.publish_status(now)
+        for label in self.labels:
+            self.logger.alerts.sensor_error(f'Channel {label}', now, exc)
+
+
+class PressureTask(AcquisitionTask):
+    def __init__(self, logger, config):
+        super().__init__(f'{logger.name}/{config["name"]}', config['sample_period'], timeout=config['timeout'],
+                         reconnect_period=logger.config['reconnect_period'])
+        self.logger = logger
+        self.config = config
+        self.log_name = config['log_name']
+        self.labels = ('P',)
+        self.buffer = SampleRingBuffer(self.labels, logger.config['buffer_capacity'])
+        self.rollups = RollupAggregator(self.labels, logger.rollup_sink(self.log_name, self.labels))
+        self.recorder = make_recorder(config['recording'], self.labels)
+        self.failed = False
+        self.device = None
+        self._reported_missing = False
+
+    # raises ValueError if a sensor was not detected, the scheduler will retry periodically
+    def connect(self):
+        self.device = ThyracontVSM(device_num=self.config['device_num'], port=self.config['port'],
+                                   port_cache_key=self.name)
+
+    def read(self):
+        return self.device.read_pressure()
+
+    def on_sample(self, timestamp, value):
+        self.failed = False
+        self.buffer.append(timestamp, (value,))
+        self.rollups.add(timestamp, (value,))
+        self.logger.publish_status(timestamp)
+        self.logger.alerts.pressure_sample(self.log_name, timestamp, value)
+        if self.recorder is not None:
+            self.logger.record(self, self.recorder.add(timestamp, (value,)))
+
+    def disconnect(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def on_error(self, exc):
+        if self.connected:
+            print(f'{self.name}: pressure sensor connection was lost')
+        elif self.stats.n_connects == 0 and self.stats.n_errors == 0 and not self._reported_missing:
+            print(f'{self.name}: pressure sensor was not detected')
+            self._reported_missing = True
+        self.failed = True
+        self.logger.publish_status(time.time())
+        # a gauge which was never found is not a dropout
+        if self.stats.n_connects > 0:
+            self.logger.alerts.sensor_error(self.log_name, time.time(), exc)
+
+
+instrument_tasks = {
+    'lakeshore335': TemperatureTask,
+    'vsm': PressureTask,
+}
+
+
+# The whole logging pipeline of one cryostat: its instruments, logs, status and Overseer bot.
+# Tasks are run by a scheduler of the LoggerProcess, logs are written by its LogWriter.
+class CryostatLogger:
+    def __init__(self, config):
+        self.config = config
+        self.name = config['name']
+        self.logs_root = path.join(os.getcwd(), config['logs_dir'])
+        self.log_format = config['log_format']
+        self.status = StatusPublisher()
+        self.alerts = AlertMonitor()
+        self.log_index = LogIndex(self.logs_root)
+        self.log_writer = None
+        self.archive = None
+        self._archive_thread = None
+        self._index_thread = None
+
+        self.day_dirs = DayDirectories(self.logs_root)
+        self.tasks = [instrument_tasks[instrument['type']](self, instrument) for instrument in config['instruments']]
+        self.temp_tasks = [task for task in self.tasks if isinstance(task, TemperatureTask)]
+        self.press_tasks = [task for task in self.tasks if isinstance(task, PressureTask)]
+        self.log_task = FunctionTask(f'{self.name}/log', self.log_current_values, config['log_period'],
+                                     start_delay=config['log_period'])
+
+    # Writes a record into the day directory of its own timestamp
+    def perform_logging_record(self, log_name, channels, values, timestamp=None):
+        log_writer = self.log_writer
+        if timestamp is None:
+            timestamp = time.time()
+        logging_dir = self.day_dirs.directory(timestamp)
+        if self.log_format in ('text', 'both'):
+            time_to_write = time.strftime('%H-%M-%S', time.localtime(timestamp))
+            log_writer.write(path.join(logging_dir, f'{log_name}.log'),
+                             ' '.join([time_to_write] + [str(v) for v in values]) + '\n')
+
+        if self.log_format in ('binary', 'both'):
+            log_writer.write_record(path.join(logging_dir, f'{log_name}.bin'), channels, timestamp, values)
+
+    # Writes finished rollup buckets into the day directory of a bucket start
+    def rollup_sink(self, log_name, channels):
+        columns = rollup_columns(channels)
+
+        def sink(tier, bucket_start, values):
+            file_path = self.day_dirs.path(rollup_file_name(log_name, tier), bucket_start)
+            self.log_writer.write_record(file_path, columns, bucket_start, values)
+        return sink
+
+    # Adds flushed log records to the time index and the archive (called by the log writer)
+    def index_flushed_logs(self, file_paths):
+        for file_path in file_paths:
+            self.log_index.update_file(file_path)
+        self.log_index.save()
+        if self.archive is not None:
+            archived_ext = '.bin' if self.log_format in ('binary', 'both') else '.log'  # full resolution
+            for file_path in file_paths:
+                log_name, ext = path.splitext(path.basename(file_path))
+                if ext == archived_ext and log_name in self.archived_logs():
+                    self.archive.ingest_file(file_path)
+
+    # Channel names of archived logs
+    def archived_logs(self):
+        return {task.log_name: task.labels for task in self.tasks}
+
+    def owns_file(self, file_path):
+        return file_path.startswith(self.logs_root + os.sep)
+
+    # Renders a status for the bot once per new sample (and dropout alerts of failing sensors).
+    # Temperatures of all controllers with recent readings are shown, warming/cooling is judged by the first one.
+    def publish_status(self, timestamp):
+        self.alerts.check_dropouts(timestamp)
+        if not any(len(task.buffer) for task in self.temp_tasks):
+            return  # still loading
+        temperatures = {}
+        for task in self.temp_tasks:
+            latest = fresh_sample(task, timestamp)
+            if latest is not None:
+                temperatures.update(zip(task.labels, latest[1]))
+        main_trend = self.temp_tasks[0].trend if fresh_sample(self.temp_tasks[0], timestamp) is not None else None
+        pressure = None
+        if self.press_tasks:
+            latest = fresh_sample(self.press_tasks[0], timestamp)
+            pressure = latest[1][0] if latest is not None else None
+        self.status.publish(temperatures, pressure, main_trend, timestamp)
+
+    # Writes records chosen by a recording policy of a task
+    def record(self, task, records):
+        for timestamp, values in records:
+            self.perform_logging_record(task.log_name, task.labels, values, timestamp)
+
+    # Writes the latest samples of tasks recorded by interval, other tasks are written by their recorders.
+    # Nothing is written for a device without a recent sample
+    def log_current_values(self):
+        now = time.time()
+        for task in self.tasks:
+            latest = fresh_sample(task, now)
+            if task.recorder is None and latest is not None:
+                self.perform_logging_record(task.log_name, task.labels, latest[1], now)
+
+    def overseer_authorize(self):
+        bot_config = self.config['bot']
+        login, password = get_bot_login_password(bot_config['auth_file'])
+        if len(login) == 0:
+            return
+        # a bot failure must not prevent logging
+        try:
+            from ARS_4K_remote import ARS_4K_slave  # the bot library is needed only with credentials
+            bot = ARS_4K_slave(login, password, bot_config['host'], bot_config['port'], self.status, self.alerts)
+            bot.launch()
+        except Exception as e:
+            print(f'{self.name}: cannot start Overseer bot:', e)
+
+    # archive_dir - a local directory of archives (see PROCESS_DEFAULTS)
+    def start(self, log_writer, event_exit, archive_dir):
+        self.log_writer = log_writer
+        # logs written before are indexed in background, acquisition does not wait for a large tree
+        self._index_thread = threading.Thread(target=self.log_index.update, name=f'{self.name}/index',
+                                              kwargs={'stop_event': event_exit})
+        self._index_thread.start()
+        if self.config['archive']:
+            archived_logs = self.archived_logs()
+            os.makedirs(archive_dir, exist_ok=True)
+            self.archive = SampleArchive(path.join(archive_dir, f'{self.name}.sqlite'), archived_logs)
+            # logs written before (or by an older version) are imported in background
+            self._archive_thread = threading.Thread(target=self.archive.import_logs, name=f'{self.name}/archive',
+                                                    args=(self.logs_root, set(archived_logs)),
+                                                    kwargs={'stop_event': event_exit})
+            self._archive_thread.start()
+
+    # Writes unfinished rollup buckets and samples held by recorders
+    def flush(self):
+        for task in self.tasks:
+            task.rollups.flush()
+            if task.recorder is not None:
+                self.record(task, task.recorder.flush())
+
+    # Called after the last log flush
+    def close(self):
+        if self._index_thread is not None:
+            self._index_thread.join()
+        if self._archive_thread is not None:
+            self._archive_thread.join()
+        if self.archive is not None:
+            self.archive.close()
+
+
+# All cryostats of a configuration in one process: one scheduler (instruments sharing a GPIB bus
+# are served in turn by its FIFO lock), one log writer and one metrics endpoint
+class LoggerProcess:
+    def __init__(self, config=None, event_exit=None):
+        self.config = config if config is not None else load_config()
+        self.event_exit = event_exit if event_exit is not None else threading.Event()
+        self.cryostats = [CryostatLogger(cryostat) for cryostat in self.config['cryostats']]
+        self.log_writer = None
+
+        self.scheduler = AcquisitionScheduler()
+        for cryostat in self.cryostats:
+            for task in cryostat.tasks:
+                self.scheduler.add_task(task)
+            self.scheduler.add_task(cryostat.log_task)
+        self.metrics_server = None
+        self._log_thread = None
+
+    # Dispatches flushed files to indices of their cryostats
+    def index_flushed_logs(self, file_paths):
+        for cryostat in self.cryostats:
+            own_paths = [file_path for file_path in file_paths if cryostat.owns_file(file_path)]
+            if own_paths:
+                cryostat.index_flushed_logs(own_paths)
+
+    # Statistics of all acquisition loops, see AcquisitionScheduler.stats
+    def get_loop_stats(self):
+        return self.scheduler.stats()
+
+    def logging_thread_proc(self):
+        for cryostat in self.cryostats:
+            cryostat.overseer_authorize()
+        self.scheduler.run_forever(self.event_exit)
+
+    def start(self):
+        config = self.config
+        spool = None
+        if config['spool_dir'] is not None:
+            spool = WriteAheadSpool(path.join(os.getcwd(), config['spool_dir']), fsync=config['spool_fsync'])
+        self.log_writer = LogWriter(config['log_flush_records'], config['log_flush_interval'], fsync=FSYNC_BATCH,
+                                    stop_event=self.event_exit, on_flush=self.index_flushed_logs, spool=spool)
+        for cryostat in self.cryostats:
+            cryostat.start(self.log_writer, self.event_exit, path.join(os.getcwd(), config['archive_dir']))
+        if config['metrics_port'] is not None:
+            try:
+                self.metrics_server = MetricsServer(config['metrics_port']).start()
+            except OSError as e:
+                print('Cannot start metrics endpoint:', e)
+        self._log_thread = threading.Thread(target=self.logging_thread_proc, name='logging')
+        self._log_thread.start()
+
+    # Blocks until event_exit is set (by a signal handler or a frontend)
+    def wait(self):
+        while not self.event_exit.wait(0.5):
+            pass
+
+    # Stops acquisition and flushes all logs
+    def stop(self):
+        self.event_exit.set()
+        if self._log_thread is not None:
+            self._log_thread.join()
+        for cryostat in self.cryostats:
+            cryostat.flush()
+        if self.log_writer is not None:
+            self.log_writer.close()
+        for cryostat in self.cryostats:
+            cryostat.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
+
+# SIGTERM (e.g. from systemd) and Ctrl+C stop the logger cleanly
+def install_signal_handlers(event_exit):
+    def handler(signum, frame):
+        event_exit.set()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ARS 4K cryostat logging tool')
+    parser.add_argument('--headless', action='store_true', help='run without the tray icon')
+    parser.add_argument('--config', help='YAML file with cryostats and instruments, see ars_logger.example.yaml')
+    args = parser.parse_args(argv)
+
+    logger = LoggerProcess(load_config(args.config))
+    install_signal_handlers(logger.event_exit)
+    logger.start()
+    try:
+        if args.headless:
+            logger.wait()
+        else:
+            from ARS_4K_tray import run_tray  # wx is imported only for the tray frontend
+            run_tray(logger.event_exit)
+    finally:
+        logger.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Tray icon frontend of the logger (needs wxPython)
+import wx
+import wx.adv
+
+TRAY_TOOLTIP = 'ARS 4K cryostat logging tool'
+TRAY_ICON = 'Monitor.ico'
+
+
+def create_menu_item(menu, label, func):
+    item = wx.MenuItem(menu, -1, label)
+    menu.Bind(wx.EVT_MENU, func, id=item.GetId())
+    menu.Append(item)
+    return item
+
+
+class TaskBarIcon(wx.adv.TaskBarIcon):
+    def __init__(self, event_exit):
+        super(TaskBarIcon, self).__init__()
+        self.event_exit = event_exit
+        self.set_icon(TRAY_ICON)
+        self.Bind(wx.adv.EVT_TASKBAR_LEFT_DOWN, self.on_left_down)
+
+        # the logger may be stopped from outside (e.g. SIGTERM), then the icon must go away too
+        self.timer = wx.Timer()
+        self.timer.Bind(wx.EVT_TIMER, self.on_timer)
+        self.timer.Start(500)
+
+    def CreatePopupMenu(self):
+        menu = wx.Menu()
+        # create_menu_item(menu, 'Say Hello', self.on_hello)
+        # menu.AppendSeparator()
+        create_menu_item(menu, 'Exit', self.on_exit)
+        return menu
+
+    def set_icon(self, icon_path):
+        icon = wx.Icon(icon_path)
+        self.SetIcon(icon, TRAY_TOOLTIP)
+
+    def on_left_down(self, event):
+        print('Tray icon was left-clicked.')
+
+    '''def on_hello(self, event):
+        print('Hello, world!')'''
+
+    def on_timer(self, event):
+        if self.event_exit.is_set():
+            self.timer.Stop()
+            wx.CallAfter(self.Destroy)
+
+    def on_exit(self, event):
+        self.event_exit.set()
+        self.timer.Stop()
+        wx.CallAfter(self.Destroy)
+
+
+# Shows a tray icon until Exit is selected or event_exit is set
+def run_tray(event_exit):
+    app = wx.App()
+    TaskBarIcon(event_exit)
+    app.MainLoop()
+    event_exit.set()
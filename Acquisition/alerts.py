@@ -0,0 +1,172 @@
+# Streaming detection of abnormal events for the Overseer bot.
+# Every new sample is checked in O(1): sudden warming, pressure spikes, zero/invalid readings
+# (LakeShore drivers return 0 on a communication error), stale temperatures (a frozen value) and
+# sensor dropouts (no valid reading for `dropout_time` seconds). A condition raises an alert only after it
+# holds for `debounce` consecutive samples and clears after it is absent for as long, so a single noisy
+# sample neither raises nor clears anything. Dropouts are debounced by time instead: reads are retried only
+# every reconnect period, so counting errors would delay an alert by minutes. Messages wait in a queue until the bot takes them.
+import math
+import threading
+from collections import deque, namedtuple
+
+from Acquisition.status import format_unicode_sci
+from Acquisition.trend import SlidingTrend
+
+WARMING = 'warming'
+PRESSURE_SPIKE = 'pressure spike'
+INVALID = 'invalid reading'
+STALE = 'stale reading'
+DROPOUT = 'dropout'
+
+Alert = namedtuple('Alert', ['timestamp', 'kind', 'source', 'active', 'message'])
+
+
+class AlertCriteria:
+    # debounce - number of consecutive samples to raise or clear an alert
+    # max_warming_rate - warming faster than this (K/min) over rate_window seconds is an alert
+    # min_rate_samples - samples in rate_window needed to judge a rate
+    # stale_samples - this many identical temperatures in a row mean a frozen sensor
+    # spike_factor - pressure above spike_factor * baseline is a spike
+    # baseline_weight - weight of a new sample in the exponential pressure baseline
+    # dropout_time - a sensor failing without a valid reading for this long (s) is a dropout
+    def __init__(self, debounce=3, max_warming_rate=0.5, rate_window=20.0, min_rate_samples=5, stale_samples=60,
+                 spike_factor=10.0, baseline_weight=0.05, dropout_time=10.0):
+        self.debounce = debounce
+        self.max_warming_rate = max_warming_rate
+        self.rate_window = rate_window
+        self.min_rate_samples = min_rate_samples
+        self.stale_samples = stale_samples
+        self.spike_factor = spike_factor
+        self.baseline_weight = baseline_weight
+        self.dropout_time = dropout_time
+
+
+# Debounced state of one condition of one source
+class _Condition:
+    def __init__(self, debounce):
+        self.debounce = debounce
+        self.active = False
+        self._count = 0
+
+    # Returns True if the state has changed
+    def update(self, present):
+        if present == self.active:
+            self._count = 0
+            return False
+        self._count += 1
+        if self._count < self.debounce:
+            return False
+        self.active = present
+        self._count = 0
+        return True
+
+
+class _ChannelState:
+    def __init__(self, criteria):
+        self.conditions = {}
+        self.criteria = criteria
+        self.trend = SlidingTrend(criteria.rate_window)
+        self.last_value = None
+        self.repeats = 0
+        self.baseline = None
+        self.last_valid_time = None
+        self.failing_since = None  # time of the last valid reading before read errors, None if reads succeed
+        self.error = None
+
+    def condition(self, kind):
+        cond = self.conditions.get(kind)
+        if cond is None:
+            # a dropout is debounced by time already
+            cond = self.conditions[kind] = _Condition(1 if kind == DROPOUT else self.criteria.debounce)
+        return cond
+
+
+class AlertMonitor:
+    def __init__(self, criteria=None, max_pending=100):
+        self.criteria = criteria if criteria is not None else AlertCriteria()
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._pending = deque(maxlen=max_pending)  # the oldest messages are dropped if the bot is away
+
+    def _state(self, source):
+        state = self._channels.get(source)
+        if state is None:
+            state = self._channels[source] = _ChannelState(self.criteria)
+        return state
+
+    def _update(self, state, kind, source, present, timestamp, message):
+        if state.condition(kind).update(present):
+            active = state.conditions[kind].active
+            text = f'⚠️{source}: {message}' if active else f'✅{source}: {kind} is over'
+            self._pending.append(Alert(timestamp, kind, source, active, text))
+
+    def _check_reading(self, state, source, timestamp, value):
+        valid = value is not None and math.isfinite(value) and value > 0
+        self._update(state, INVALID, source, not valid, timestamp, f'invalid reading {value}')
+        state.last_valid_time = timestamp
+        state.failing_since = None
+        self._update(state, DROPOUT, source, False, timestamp, '')
+        return valid
+
+    # A temperature (K) of a channel, source - a channel name
+    def temperature_sample(self, source, timestamp, value):
+        crit = self.criteria
+        with self._lock:
+            state = self._state(source)
+            if not self._check_reading(state, source, timestamp, value):
+                state.last_value = None
+                return
+            # a live sensor is never exactly equal for a minute, a frozen value means a hung controller or a cable
+            state.repeats = state.repeats + 1 if value == state.last_value else 0
+            state.last_value = value
+            self._update(state, STALE, source, state.repeats >= crit.stale_samples, timestamp,
+                         f'reading is frozen at {value}')
+            state.trend.add(timestamp, value)
+            slope = state.trend.slope if len(state.trend) >= crit.min_rate_samples else None
+            rate = slope * 60 if slope is not None else 0.0
+            self._update(state, WARMING, source, rate > crit.max_warming_rate, timestamp,
+                         f'sudden warming {rate:+.3f} K/min at {value:.3f} K')
+
+    # A pressure (mbar) of a gauge, source - a gauge name
+    def pressure_sample(self, source, timestamp, value):
+        crit = self.criteria
+        with self._lock:
+            state = self._state(source)
+            if not self._check_reading(state, source, timestamp, value):
+                return
+            if state.baseline is None:
+                state.baseline = value
+            spike = value > crit.spike_factor * state.baseline
+            self._update(state, PRESSURE_SPIKE, source, spike, timestamp,
+                         f'pressure spike {format_unicode_sci(value)} mbar '
+                         f'(usually {format_unicode_sci(state.baseline)} mbar)')
+            # a baseline follows slow changes and is not pulled up by spikes
+            if not spike:
+                state.baseline += crit.baseline_weight * (value - state.baseline)
+
+    def _check_dropout(self, state, source, timestamp):
+        if state.failing_since is not None and timestamp - state.failing_since >= self.criteria.dropout_time:
+            self._update(state, DROPOUT, source, True, timestamp, f'sensor does not respond ({state.error})')
+
+    # A failed read of a sensor
+    def sensor_error(self, source, timestamp, exc=None):
+        with self._lock:
+            state = self._state(source)
+            if state.failing_since is None:
+                state.failing_since = state.last_valid_time if state.last_valid_time is not None else timestamp
+            state.error = exc
+            self._check_dropout(state, source, timestamp)
+
+    # Raises dropouts of failing sensors which reached dropout_time, called periodically
+    # (a failing sensor reports errors only once per reconnect period)
+    def check_dropouts(self, timestamp):
+        with self._lock:
+            for source, state in self._channels.items():
+                self._check_dropout(state, source, timestamp)
+
+    # Takes messages of alerts raised or cleared since the previous call
+    def drain(self):
+        with self._lock:
+            messages = [alert.message for alert in self._pending]
+            self._pending.clear()
+        return messages
@@ -0,0 +1,83 @@
+# A fixed-size thread-safe ring buffer of timestamped multi-channel samples.
+# Memory is preallocated once. Every sample is written twice (at i and i + capacity),
+# so the latest samples are always a contiguous slice and can be returned as views without copying.
+import threading
+
+import numpy as np
+
+
+# A consistent view of the latest samples of a buffer.
+# Arrays are views into the buffer: a snapshot of n samples stays valid for capacity - n more samples only
+# (a full snapshot of capacity - 1 samples - until the next append),
+# use SampleRingBuffer.snapshot(copy=True) to keep them longer
+class Snapshot:
+    def __init__(self, times, values, version):
+        self.times = times
+        self.values = values  # channel name: array
+        self.version = version  # total number of samples added to the buffer when the snapshot was taken
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, chan):
+        return self.values[chan]
+
+
+class SampleRingBuffer:
+    def __init__(self, channels, capacity):
+        if capacity < 2:
+            raise ValueError('Ring buffer capacity must be at least 2')
+        self.channels = tuple(channels)
+        self.capacity = capacity
+        self._times = np.full(2 * capacity, np.nan)
+        self._values = {chan: np.full(2 * capacity, np.nan) for chan in self.channels}
+        self._pos = 0  # position of the next write
+        self._count = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    # Adds one sample, values in the order of channels (all channels are written together)
+    def append(self, timestamp, values):
+        with self._lock:
+            pos = self._pos
+            self._times[pos] = timestamp
+            self._times[pos + self.capacity] = timestamp
+            for chan, value in zip(self.channels, values):
+                arr = self._values[chan]
+                arr[pos] = np.nan if value is None else value
+                arr[pos + self.capacity] = arr[pos]
+            self._pos = (pos + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._version += 1
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def version(self):
+        return self._version
+
+    # Latest samples: n=None - all stored samples (up to capacity - 1).
+    # Views of n samples are overwritten after capacity - n appends (see Snapshot): use copy=True for a snapshot
+    # read outside of the acquisition thread unless n is well below capacity
+    def snapshot(self, n=None, copy=False):
+        with self._lock:
+            count = min(self._count, self.capacity - 1)
+            if n is not None:
+                count = min(count, n)
+            end = self._pos + self.capacity
+            start = end - count
+            times = self._times[start:end]
+            values = {chan: arr[start:end] for chan, arr in self._values.items()}
+            if copy:
+                times = times.copy()
+                values = {chan: arr.copy() for chan, arr in values.items()}
+            return Snapshot(times, values, self._version)
+
+    # The latest sample as (timestamp, tuple of values) or None if the buffer is empty
+    def latest(self):
+        with self._lock:
+            if self._count == 0:
+                return None
+            i = self._pos - 1 + self.capacity
+            return float(self._times[i]), tuple(float(self._values[chan][i]) for chan in self.channels)
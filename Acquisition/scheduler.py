@@ -0,0 +1,219 @@
+# An asyncio based acquisition scheduler.
+# Every instrument (or any other periodic job, e.g. log writing) is polled by its own coroutine
+# with its own period. Blocking serial/VISA I/O runs in a separate executor thread for each task,
+# so a slow or hung device never delays other instruments.
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Instrumentation.metrics import loop_intervals, loop_overruns, loop_targets, task_connects, task_errors
+
+
+# Timing statistics of one task loop
+class LoopStats:
+    def __init__(self, period):
+        self.period = period
+        self.n_samples = 0
+        self.n_errors = 0
+        self.n_timeouts = 0
+        self.n_overruns = 0  # loop iterations which took longer than the period
+        self.n_connects = 0
+        self.n_sample_errors = 0  # exceptions of on_sample, the device itself is fine
+        self.last_duration = None  # duration of the last read (s)
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_interval = None  # actual time between the two last read starts (s)
+        self.last_start = None
+
+    def add_read(self, start, duration):
+        if self.last_start is not None:
+            self.last_interval = start - self.last_start
+        self.last_start = start
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+
+    @property
+    def mean_duration(self):
+        n_reads = self.n_samples + self.n_errors
+        if n_reads == 0:
+            return None
+        return self.total_duration / n_reads
+
+    def as_dict(self):
+        return {'period': self.period,
+                'samples': self.n_samples,
+                'errors': self.n_errors,
+                'timeouts': self.n_timeouts,
+                'overruns': self.n_overruns,
+                'connects': self.n_connects,
+                'sample_errors': self.n_sample_errors,
+                'last_duration': self.last_duration,
+                'mean_duration': self.mean_duration,
+                'max_duration': self.max_duration,
+                'last_interval': self.last_interval}
+
+
+# A periodic acquisition task. Override connect/read (called in an executor thread)
+# and on_sample/on_error (called in the event loop thread) in child classes.
+# name - task name used in statistics
+# period - time between two reads (s)
+# timeout - maximal read duration (s), None - wait forever
+# reconnect_period - time between connection attempts after a failure (s)
+# start_delay - time before the first read (s)
+class AcquisitionTask:
+    def __init__(self, name, period, timeout=None, reconnect_period=30, start_delay=0):
+        self.name = name
+        self.period = period
+        self.timeout = timeout
+        self.reconnect_period = reconnect_period
+        self.start_delay = start_delay
+        self.connected = False
+        self.stats = LoopStats(period)
+
+    # Connects a device, must raise an exception on failure
+    def connect(self):
+        pass
+
+    # Frees a device after errors or at exit
+    def disconnect(self):
+        pass
+
+    # Performs one read, returns a sample value
+    def read(self):
+        raise NotImplementedError
+
+    # Processes a sample. An exception here is reported but does not disconnect the device
+    def on_sample(self, timestamp, value):
+        pass
+
+    # Called on read/connect errors and timeouts
+    def on_error(self, exc):
+        print(f'{self.name}: {type(exc).__name__} {exc}')
+
+
+# A task calling a plain function periodically
+class FunctionTask(AcquisitionTask):
+    def __init__(self, name, func, period, **kwargs):
+        super().__init__(name, period, **kwargs)
+        self._func = func
+
+    def read(self):
+        return self._func()
+
+
+class AcquisitionScheduler:
+    def __init__(self):
+        self._tasks = []
+        self._executors = {}
+
+    def add_task(self, task: AcquisitionTask):
+        self._tasks.append(task)
+        return task
+
+    @property
+    def tasks(self):
+        return list(self._tasks)
+
+    # Loop timing statistics of all tasks: {task name: dict}
+    def stats(self):
+        return {task.name: task.stats.as_dict() for task in self._tasks}
+
+    async def _call(self, task, func):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executors[task.name], func)
+        if task.timeout is None:
+            return await future
+        # shield: a timed out call cannot be interrupted, it keeps running in its thread
+        return await asyncio.wait_for(asyncio.shield(future), task.timeout)
+
+    async def _connect(self, task):
+        while not task.connected:
+            try:
+                await self._call(task, task.connect)
+                task.connected = True
+                task.stats.n_connects += 1
+                task_connects.inc(task.name)
+            except Exception as e:
+                task.on_error(e)
+                await asyncio.sleep(task.reconnect_period)
+
+    async def _run_task(self, task):
+        loop = asyncio.get_running_loop()
+        if task.start_delay > 0:
+            await asyncio.sleep(task.start_delay)
+        loop_targets.set(task.period, task.name)
+        await self._connect(task)
+        next_time = loop.time()
+        while True:
+            start = time.monotonic()
+            try:
+                value = await self._call(task, task.read)
+                task.stats.add_read(start, time.monotonic() - start)
+                if task.stats.last_interval is not None:
+                    loop_intervals.observe(task.stats.last_interval, task.name)
+                task.stats.n_samples += 1
+            except Exception as e:
+                task.stats.add_read(start, time.monotonic() - start)
+                task.stats.n_errors += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    task.stats.n_timeouts += 1
+                    task_errors.inc(task.name, 'timeout')
+                else:
+                    task_errors.inc(task.name, 'error')
+                task.on_error(e)
+                task.connected = False
+                try:
+                    await self._call(task, task.disconnect)
+                except Exception:
+                    pass
+                await asyncio.sleep(task.reconnect_period)
+                await self._connect(task)
+                next_time = loop.time()
+                continue
+
+            # a bug in processing (a full disk, a bad value) is not a device error, the device stays connected
+            try:
+                task.on_sample(time.time(), value)
+            except Exception as e:
+                task.stats.n_sample_errors += 1
+                task_errors.inc(task.name, 'sample')
+                print(f'{task.name}: sample processing failed: {type(e).__name__} {e}')
+
+            next_time += task.period
+            delay = next_time - loop.time()
+            if delay < 0:
+                if task.period > 0:
+                    task.stats.n_overruns += 1
+                    loop_overruns.inc(task.name)
+                next_time = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    # Runs all tasks until stop_event (threading.Event) is set
+    async def run(self, stop_event: threading.Event):
+        loop = asyncio.get_running_loop()
+        for task in self._tasks:
+            self._executors[task.name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=task.name)
+        running = [asyncio.ensure_future(self._run_task(task)) for task in self._tasks]
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(0.1)
+        finally:
+            for fut in running:
+                fut.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for task in self._tasks:
+                try:
+                    future = loop.run_in_executor(self._executors[task.name], task.disconnect)
+                    await asyncio.wait_for(future, 5)
+                except Exception:
+                    pass
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            self._executors = {}
+
+    # Blocking version of run, e.g. for a logging thread
+    def run_forever(self, stop_event: threading.Event):
+        asyncio.run(self.run(stop_event))
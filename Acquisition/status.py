@@ -0,0 +1,94 @@
+# A precomputed status snapshot for the Overseer bot.
+# The acquisition loop publishes an immutable snapshot with the latest values, trend and a rendered
+# message once per new sample; bot requests are served from it without any computations.
+import math
+import threading
+import time
+from collections import namedtuple
+
+# sequence - increases only when the message changes, so a bot can skip pushing identical status
+StatusSnapshot = namedtuple('StatusSnapshot', ['sequence', 'timestamp', 'temperatures', 'pressure', 'status',
+                                               'rates', 'message'])
+
+LOADING_MESSAGE = "Please wait, loading..."
+
+_SUPERSCRIPT = str.maketrans("-0123456789", "⁻⁰¹²³⁴⁵⁶⁷⁸⁹")
+
+
+def format_unicode_sci(number):
+    try:
+        exponent = int(round(math.log10(abs(number))))
+        mantis = number / 10 ** exponent
+
+        # format like it is shown on a sensor
+        if mantis < 1:
+            mantis *= 10
+            exponent -= 1
+
+        return f"{mantis:.2f}·10{str(exponent).translate(_SUPERSCRIPT)}"
+    except Exception:
+        return str(number)
+
+
+def format_window(window):
+    if window % 3600 == 0:
+        return f'{window // 3600} h'
+    if window % 60 == 0:
+        return f'{window // 60} min'
+    return f'{window} s'
+
+
+NO_READINGS_STATUS = '⚠️No readings from the temperature controller'
+
+
+# Determines warming/cooling status of the main channel from a TrendEstimator, returns (status, {window: K/min}).
+# temp_trend is None when the main channel has no recent readings
+def trend_status(temp_trend):
+    if temp_trend is None:
+        return NO_READINGS_STATUS, {}
+    status_window = min(temp_trend.windows)
+    rate = temp_trend.rate_per_minute(status_window)
+    if temp_trend.n_samples(status_window) < 5 or rate is None:
+        return 'Gathering statistics...', {}
+    if rate > 0:
+        status = '🔴Warming'
+    else:
+        status = '🟢Cooling'
+    if abs(temp_trend.change(status_window)) < 0.2:
+        status = '🔵Approx. stable'
+    rates = {w: r for w, r in temp_trend.rates_per_minute().items() if r is not None}
+    return status, rates
+
+
+def render_message(temperatures, pressure, status, rates):
+    if rates:
+        status += '\nRate: ' + ', '.join(f'{r:+.4f} K/min ({format_window(w)})' for w, r in rates.items())
+    message = 'Temperatures:' + ''.join(f'\n✔Channel {chan}: {temp:.3f} K' for chan, temp in temperatures.items())
+
+    if pressure is not None:
+        message += f'\n\n Pressure:\n {format_unicode_sci(pressure)} mBar'
+    return '\n' + status + '\n\n' + message
+
+
+# Holds the latest StatusSnapshot, readers in other threads just take a reference
+class StatusPublisher:
+    def __init__(self):
+        self._snapshot = StatusSnapshot(0, None, {}, None, None, {}, LOADING_MESSAGE)
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    # Builds and publishes a snapshot, returns it.
+    # temperatures - {channel: value} of channels with recent readings,
+    # temp_trend - TrendEstimator of the main channel, None if it has no recent readings
+    def publish(self, temperatures, pressure, temp_trend, timestamp=None):
+        status, rates = trend_status(temp_trend)
+        message = render_message(temperatures, pressure, status, rates)
+        with self._lock:
+            old = self._snapshot
+            sequence = old.sequence if message == old.message else old.sequence + 1
+            self._snapshot = StatusSnapshot(sequence, timestamp if timestamp is not None else time.time(),
+                                            dict(temperatures), pressure, status, rates, message)
+            return self._snapshot
@@ -0,0 +1,135 @@
+# Incremental least-squares trend of a sample stream over sliding time windows.
+# Running sums are updated on every sample, so slope and intercept are available in O(1).
+import math
+import threading
+from collections import deque
+
+
+# Linear fit y = slope * t + intercept over samples of the last `window` seconds (real timestamps)
+class SlidingTrend:
+    def __init__(self, window):
+        self.window = window
+        self._samples = deque()
+        self._t0 = None  # times are stored relative to t0 to keep the sums precise
+        self._s_t = self._s_y = self._s_tt = self._s_ty = self._s_yy = 0.0
+
+    def _add_sums(self, t, y, sign):
+        self._s_t += sign * t
+        self._s_y += sign * y
+        self._s_tt += sign * t * t
+        self._s_ty += sign * t * y
+        self._s_yy += sign * y * y
+
+    # Moves t0 to the oldest sample and recomputes the sums (amortized O(1): done once per many windows)
+    def _rebase(self):
+        if not self._samples:
+            self._t0 = None
+            self._s_t = self._s_y = self._s_tt = self._s_ty = self._s_yy = 0.0
+            return
+        new_t0 = self._t0 + self._samples[0][0]
+        self._samples = deque((t + self._t0 - new_t0, y) for t, y in self._samples)
+        self._t0 = new_t0
+        self._s_t = self._s_y = self._s_tt = self._s_ty = self._s_yy = 0.0
+        for t, y in self._samples:
+            self._add_sums(t, y, 1)
+
+    def add(self, timestamp, value):
+        if value is None or math.isnan(value):
+            return
+        if self._t0 is None:
+            self._t0 = timestamp
+        t = timestamp - self._t0
+        self._samples.append((t, value))
+        self._add_sums(t, value, 1)
+        while self._samples and t - self._samples[0][0] > self.window:
+            old_t, old_y = self._samples.popleft()
+            self._add_sums(old_t, old_y, -1)
+        if t > 10 * self.window:
+            self._rebase()
+
+    def __len__(self):
+        return len(self._samples)
+
+    # Time span covered by the stored samples (s)
+    @property
+    def span(self):
+        if not self._samples:
+            return 0.0
+        return self._samples[-1][0] - self._samples[0][0]
+
+    # Slope in units per second, None if there are not enough samples
+    @property
+    def slope(self):
+        n = len(self._samples)
+        if n < 2:
+            return None
+        denominator = n * self._s_tt - self._s_t * self._s_t
+        if denominator <= 0:
+            return None
+        return (n * self._s_ty - self._s_t * self._s_y) / denominator
+
+    # Fitted value at a given timestamp
+    def value_at(self, timestamp):
+        slope = self.slope
+        if slope is None:
+            return None
+        n = len(self._samples)
+        intercept = (self._s_y - slope * self._s_t) / n
+        return slope * (timestamp - self._t0) + intercept
+
+    # Mean value of the window
+    @property
+    def mean(self):
+        if not self._samples:
+            return None
+        return self._s_y / len(self._samples)
+
+    # Standard deviation of values around their mean
+    @property
+    def std(self):
+        n = len(self._samples)
+        if n < 2:
+            return None
+        mean = self._s_y / n
+        return math.sqrt(max(self._s_yy / n - mean * mean, 0.0))
+
+    # Difference between the last and the first sample of the window
+    @property
+    def change(self):
+        if not self._samples:
+            return None
+        return self._samples[-1][1] - self._samples[0][1]
+
+
+# Several sliding trends of one channel, e.g. for 1 min, 10 min and 1 h (thread-safe)
+class TrendEstimator:
+    def __init__(self, windows=(60, 600, 3600)):
+        self._trends = {window: SlidingTrend(window) for window in windows}
+        self._lock = threading.Lock()
+
+    @property
+    def windows(self):
+        return tuple(self._trends)
+
+    def add(self, timestamp, value):
+        with self._lock:
+            for trend in self._trends.values():
+                trend.add(timestamp, value)
+
+    # Slope of a window in units per minute (K/min for temperatures), None if not enough data
+    def rate_per_minute(self, window):
+        with self._lock:
+            slope = self._trends[window].slope
+        return None if slope is None else slope * 60
+
+    # {window: rate per minute} for all windows
+    def rates_per_minute(self):
+        return {window: self.rate_per_minute(window) for window in self._trends}
+
+    def n_samples(self, window):
+        with self._lock:
+            return len(self._trends[window])
+
+    def change(self, window):
+        with self._lock:
+            return self._trends[window].change
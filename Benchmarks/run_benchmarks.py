@@ -0,0 +1,280 @@
+# Benchmarks of the logging pipeline on simulated instruments.
+# Run from the repository root:
+#   python -m Benchmarks.run_benchmarks --output benchmark_results.json
+# Results are written as JSON to compare them between driver versions.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from os import path
+from types import SimpleNamespace
+
+import numpy as np
+
+os.environ.setdefault('ARS_SIMULATION', '1')
+os.environ.setdefault('ARS_SIMULATION_MODE', 'stable')
+
+from ARS_4K_core import scan_temperatures
+from Acquisition.scheduler import AcquisitionScheduler, AcquisitionTask
+from Acquisition.status import StatusPublisher
+from Acquisition.trend import TrendEstimator
+from Drivers.LakeShore335 import LakeShore335
+from Drivers.rate_limiter import RateLimiter
+from Drivers.visa_pool import pool, SIM_BACKEND
+from Simulation.cryostat_model import LinkParams
+from Storage.log_writer import LogWriter
+
+TEMP_CHANNELS = ('A', 'B')
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {'p50': float(np.percentile(values, 50)), 'p99': float(np.percentile(values, 99)),
+            'mean': float(values.mean()), 'max': float(values.max()), 'n': int(len(values))}
+
+
+# Write syscalls and written bytes of this process (Linux only)
+def io_counters():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['syscw']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def connect_lakeshore(latency, jitter):
+    pool.resource_manager(SIM_BACKEND).link = LinkParams(latency=latency, jitter=jitter)
+    return LakeShore335(device_num=12, control_channel='A', heater_channel=1, mode='passive', verbose=False)
+
+
+def bench_get_temperature(device, n_reads):
+    latencies = []
+    for i in range(n_reads):
+        start = time.perf_counter()
+        device.GetTemperature()
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+class _TemperatureTask(AcquisitionTask):
+    def __init__(self, device):
+        super().__init__('temperature', 0, timeout=10)
+        self.device = device
+
+    def read(self):
+        return scan_temperatures(self.device, TEMP_CHANNELS)
+
+
+# Samples per second per channel with the acquisition loop running as fast as the device allows
+def bench_acquisition(device, duration):
+    scheduler = AcquisitionScheduler()
+    task = scheduler.add_task(_TemperatureTask(device))
+    stop = threading.Event()
+    timer = threading.Timer(duration, stop.set)
+    timer.start()
+    start = time.perf_counter()
+    scheduler.run_forever(stop)
+    elapsed = time.perf_counter() - start
+    stats = task.stats.as_dict()
+    return {'samples_per_second_per_channel': stats['samples'] / elapsed,
+            'channels': len(TEMP_CHANNELS),
+            'loop_stats': stats}
+
+
+def _legacy_record(temp_file, press_file, temp_A, temp_B, pressure):
+    time_to_write = time.strftime('%H-%M-%S')
+    with open(temp_file, 'a') as f:
+        f.write(f'{time_to_write} {temp_A} {temp_B}\n')
+    with open(press_file, 'a') as f:
+        f.write(f'{time_to_write} {pressure}\n')
+
+
+# Bytes and write syscalls per record: batched LogWriter vs open/append/close per record
+def bench_log_writes(n_records):
+    results = {}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for variant in ('log_writer', 'legacy_open_per_record'):
+            temp_file = path.join(tmp_dir, f'{variant}_Temperature.log')
+            press_file = path.join(tmp_dir, f'{variant}_Pressure.log')
+            before = io_counters()
+            start = time.perf_counter()
+            if variant == 'log_writer':
+                writer = LogWriter(flush_records=10, flush_interval=60)
+                for i in range(n_records):
+                    time_to_write = time.strftime('%H-%M-%S')
+                    writer.write(temp_file, f'{time_to_write} {4.0 + i * 1e-4} {3.5}\n')
+                    writer.write(press_file, f'{time_to_write} {1.2e-6}\n')
+                writer.close()
+            else:
+                for i in range(n_records):
+                    _legacy_record(temp_file, press_file, 4.0 + i * 1e-4, 3.5, 1.2e-6)
+            elapsed = time.perf_counter() - start
+            after = io_counters()
+            res = {'seconds_per_record': elapsed / n_records,
+                   'bytes_per_record': (path.getsize(temp_file) + path.getsize(press_file)) / n_records}
+            if before is not None and after is not None:
+                res['write_syscalls_per_record'] = (after[0] - before[0]) / n_records
+                res['written_bytes_per_record'] = (after[1] - before[1]) / n_records
+            results[variant] = res
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+# Gaps between the end of a command and the start of the next one through a RateLimiter,
+# for commands shorter and longer than the interval; the minimal gap must not be less than the interval
+def bench_rate_limiter(min_interval=0.05, n_commands=20):
+    results = {}
+    for name, duration in (('fast_commands', min_interval / 2), ('slow_commands', min_interval * 1.5)):
+        limiter = RateLimiter(min_interval)
+        gaps = []
+        end = None
+        for i in range(n_commands):
+            with limiter:
+                start = time.monotonic()
+                if end is not None:
+                    gaps.append(start - end)
+                time.sleep(duration)
+                end = time.monotonic()
+        res = percentiles(gaps)
+        res['min'] = float(np.min(gaps))
+        res['spacing_holds'] = bool(res['min'] >= min_interval * 0.99)
+        results[name] = res
+    return results
+
+
+# A fake instrument for scheduler checks: reads take `duration` seconds, on_sample fails if `failing`
+class _FakeTask(AcquisitionTask):
+    def __init__(self, name, period, duration=0.0, failing=False, **kwargs):
+        super().__init__(name, period, **kwargs)
+        self.duration = duration
+        self.failing = failing
+
+    def read(self):
+        time.sleep(self.duration)
+        return 1.0
+
+    def on_sample(self, timestamp, value):
+        if self.failing:
+            raise ValueError('sample processing failure')
+
+    def on_error(self, exc):
+        pass
+
+
+# Scheduler isolation with fake drivers: a hung gauge (reads longer than its timeout) must not delay
+# a fast instrument, and failures of on_sample must not disconnect a device
+def bench_scheduler(duration=2.0, period=0.05):
+    scheduler = AcquisitionScheduler()
+    fast = scheduler.add_task(_FakeTask('fast', period))
+    hung = scheduler.add_task(_FakeTask('hung', period, duration=1.0, timeout=0.2, reconnect_period=0.1))
+    failing = scheduler.add_task(_FakeTask('failing', period, failing=True))
+    intervals = []
+    fast.on_sample = lambda timestamp, value: intervals.append(fast.stats.last_interval)
+    stop = threading.Event()
+    timer = threading.Timer(duration, stop.set)
+    timer.start()
+    scheduler.run_forever(stop)
+    intervals = [interval for interval in intervals if interval is not None]
+    res = {'fast_interval': percentiles(intervals),
+           'hung_timeouts': hung.stats.n_timeouts,
+           'failing_sample_errors': failing.stats.n_sample_errors,
+           'failing_connects': failing.stats.n_connects}
+    res['fast_not_delayed'] = bool(res['fast_interval']['max'] < period + 0.1)
+    res['failing_stays_connected'] = bool(failing.stats.n_connects == 1 and failing.stats.n_errors == 0)
+    return res
+
+
+# Time and allocations of status publishing (once per sample) and of a bot info request
+def bench_status(n_calls):
+    publisher = StatusPublisher()
+    trend = TrendEstimator()
+    t0 = time.time()
+    for i in range(3600):
+        trend.add(t0 + i, 4.0 + 1e-4 * i)
+
+    def publish():
+        publisher.publish({'A': 4.0, 'B': 3.5}, 1.2e-6, trend, t0)
+
+    results = {'publish_status': _time_and_allocations(publish, n_calls)}
+    try:
+        from ARS_4K_remote import ARS_4K_slave
+    except ImportError as e:
+        results['generate_info_message'] = {'skipped': str(e)}
+        return results
+    bot = SimpleNamespace(_status=publisher, _last_sent_sequence=None)
+    results['generate_info_message'] = _time_and_allocations(lambda: ARS_4K_slave.generate_info_message(bot),
+                                                             n_calls)
+    return results
+
+
+def _time_and_allocations(func, n_calls):
+    times = []
+    for i in range(n_calls):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    for i in range(n_calls):
+        func()
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, 'filename')
+    res = percentiles(times)
+    res['allocations_per_call'] = sum(s.count_diff for s in stats if s.count_diff > 0) / n_calls
+    res['allocated_bytes_per_call'] = sum(s.size_diff for s in stats if s.size_diff > 0) / n_calls
+    return res
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the ARS 4K logging pipeline')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated instrument latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='simulated instrument jitter (s)')
+    parser.add_argument('--reads', type=int, default=200, help='GetTemperature calls')
+    parser.add_argument('--duration', type=float, default=5, help='acquisition loop run time (s)')
+    parser.add_argument('--records', type=int, default=1000, help='log records')
+    parser.add_argument('--calls', type=int, default=1000, help='status calls')
+    args = parser.parse_args()
+
+    device = connect_lakeshore(args.latency, args.jitter)
+    try:
+        results = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                            'git_revision': git_revision(),
+                            'python': sys.version.split()[0],
+                            'platform': platform.platform(),
+                            'simulated_latency': args.latency,
+                            'simulated_jitter': args.jitter},
+                   'get_temperature_latency': bench_get_temperature(device, args.reads),
+                   'acquisition': bench_acquisition(device, args.duration)}
+    finally:
+        device.close()
+    results['log_writes'] = bench_log_writes(args.records)
+    results['status'] = bench_status(args.calls)
+    results['rate_limiter'] = bench_rate_limiter()
+    results['scheduler'] = bench_scheduler()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,30 @@
+from os import path
+
 from Drivers.LakeShoreBase import *
+from Drivers.param_schedule import load_schedule
 
 
 class LakeShore335(LakeShoreBase):
+    # Temperature inputs in the order they are returned by KRDG? 0
+    _input_letters = ('A', 'B')
+
+    # The 335 handles queries on GPIB reliably when they are spaced by about 50 ms
+    min_command_interval = 0.05
+
+    # Default table of temperature dependent parameters
+    default_params_file = path.join(path.dirname(path.abspath(__file__)), 'LakeShore335_params.yaml')
+
     # Class constructor
     # Control channel: A or B
     # Heater channel: 1 or 2
+    # params_file - YAML table of excitation, heater range and PID depending on temperature (see param_schedule)
     def __init__(self, device_num, control_channel, heater_channel, temp_0=None, max_temp=1.7, verbose=True, mode="active",
-                 temp_step=0.1):
-        input_letters = {'A', 'B'}
-        if control_channel not in input_letters:
+                 temp_step=0.1, params_file=None):
+        if control_channel not in self._input_letters:
             raise ValueError('Please set a valid input channel: A or B')
         self._temp_channel = control_channel
         self._heater_channel = heater_channel
+        self._schedule = load_schedule(params_file if params_file is not None else self.default_params_file)
 
         super().__init__(device_num, control_channel, temp_0, max_temp, verbose, mode, temp_step)
 
@@ -30,41 +43,41 @@ class LakeShore335(LakeShoreBase):
     # device parameter setters
     def _set_pid(self, pid):
         chan = self._heater_channel
-        self.device.write(f'PID {chan},{pid}')
+        self.SendString(f'PID {chan},{pid}')
         super()._set_pid(pid)
 
     def _set_heater_range(self, htrrng):
         chan = self._heater_channel
-        self.device.write(f'RANGE {chan},{htrrng}')
+        self.SendString(f'RANGE {chan},{htrrng}')
         super()._set_heater_range(htrrng)
 
     def _set_excitation(self, excitation):
         chan = self._temp_channel
-        self.device.write(f'INTYPE {chan},{self._intype_sensor_type},{self._intype_autorange},{excitation},{self._intype_compensation},{self._intype_units}')
+        self.SendString(f'INTYPE {chan},{self._intype_sensor_type},{self._intype_autorange},{excitation},{self._intype_compensation},{self._intype_units}')
         super()._set_excitation(excitation)
 
     def _set_channel(self, chan):
         super()._set_channel(chan)
 
-    # Functions for updating LakeShore params depending on temperature
-    # Updates thermometer excitation in dependence of temperature
-    @staticmethod
-    def _get_excitation_for_temperature(temp):
-        # TODO: measure in different temperature ranges and find where '2' must be
-        n_setting = 1
-        return n_setting
+    # Functions for updating LakeShore params depending on temperature, values are taken from a table
+    def _get_excitation_from_temperature(self, temp):
+        return self._schedule.lookup(temp, 'excitation')
 
-    @staticmethod
-    def _get_heater_range_from_temperature(temp):
-        return 0  # TODO measure in different temperature ranges and set another values there
+    def _get_heater_range_from_temperature(self, temp):
+        return self._schedule.lookup(temp, 'heater_range')
 
     def _get_pid_from_temperature(self, temp):
-        return "5,2,0"  # TODO measure in different temperature ranges and set another values there
+        return self._schedule.lookup(temp, 'pid')
 
     def _remember_old_params(self):
         self._get_intype()
-        self.__old_pid = self.GetString(f'PID? {self._heater_channel}')
+        self.__old_pid = self.GetString(f'PID? {self._heater_channel}').strip()
         self._pid = self.__old_pid
+        self._excitation = self._intype_range
+        try:
+            self._htrrng = int(self.GetString(f'RANGE? {self._heater_channel}'))
+        except ValueError:
+            self._htrrng = None  # unknown, will be written at the first update
 
     def _restore_old_params(self):
         self._set_excitation(self._intype_range)
@@ -78,6 +91,16 @@ class LakeShore335(LakeShoreBase):
     def _meas_temperature(self):
         return self.GetFloat(f'KRDG? {self._temp_channel}')
 
+    # Measures all requested inputs at once: KRDG? 0 returns readings of all inputs separated by commas,
+    # so no channel switching is needed
+    def _meas_temperatures(self, channels):
+        for chan in channels:
+            if chan not in self._input_letters:
+                raise ValueError('Please set a valid input channel: A or B')
+        resp = self.GetString('KRDG? 0')
+        values = dict(zip(self._input_letters, resp.strip().split(',')))
+        return [float(values[chan]) for chan in channels]
+
     # Changes a setpoint
     def _set_setpoint(self, setp):
         chan = self._heater_channel
@@ -1,4 +1,5 @@
 from Drivers import visa_device
+from Drivers.settle_detector import SettleCriterion, wait_settled, TIMEOUT
 import numpy as np
 import time
 import threading
@@ -19,6 +20,9 @@ class PIDLoopType(Enum):
 
 
 class LakeShoreBase(visa_device.visa_device):
+    # Conservative command spacing for LakeShore models without a tuned value
+    min_command_interval = 0.5
+
     # device parameter setters
     # all of them must be overridden in child classes
     # and overriding methods must call super()._set_pid
@@ -49,10 +53,20 @@ class LakeShoreBase(visa_device.visa_device):
         # must be overridden in a child class
         return 0
 
-    # Updates thermometer excitation in dependence of temperature
+    # PID strings are compared as numbers: the device returns "+5.0000,+2.0000,+0.0000" for "5,2,0"
+    @staticmethod
+    def _pid_key(pid):
+        try:
+            return tuple(float(v) for v in str(pid).split(','))
+        except ValueError:
+            return pid
+
+    # Updates thermometer excitation in dependence of temperature.
+    # Update functions send a command only if a value differs from the last written one
     def _update_excitation(self, T):
         n_setting = self._get_excitation_from_temperature(T)
-        self._set_excitation(n_setting)
+        if n_setting != self._excitation:
+            self._set_excitation(n_setting)
 
     @staticmethod
     def _get_heater_range_from_temperature(temp):
@@ -62,7 +76,8 @@ class LakeShoreBase(visa_device.visa_device):
     # Updates heater range in dependence of temperature
     def _update_heater_range(self, T):
         rng = self._get_heater_range_from_temperature(T)
-        self._set_heater_range(rng)
+        if rng != self._htrrng:
+            self._set_heater_range(rng)
 
     def _get_pid_from_temperature(self, temp):
         # must be overridden in a child class
@@ -71,7 +86,8 @@ class LakeShoreBase(visa_device.visa_device):
     # Updates PID in dependence of temperature
     def _update_pid(self, T):
         new_pid = self._get_pid_from_temperature(T)
-        self._set_pid(new_pid)
+        if self._pid_key(new_pid) != self._pid_key(self._pid):
+            self._set_pid(new_pid)
 
     # Main function which is updating LakeShore parameters at each temperature change
     def _update_params(self, T):
@@ -97,28 +113,51 @@ class LakeShoreBase(visa_device.visa_device):
         # must be overridden in a child class
         return 0
 
+    # Measure temperatures of several channels, returns a list of readings in the same order.
+    # Default implementation switches channels one by one,
+    # override it in a child class if a device can read all inputs in one query
+    def _meas_temperatures(self, channels):
+        old_chan = self._temp_channel
+        temps = []
+        for chan in channels:
+            if chan != self._temp_channel:
+                self.temp_channel = chan
+            temps.append(self._meas_temperature())
+        if self._temp_channel != old_chan:
+            self.temp_channel = old_chan
+        return temps
+
+    # Command spacing is done by the device rate limiter (see visa_device),
+    # the lock keeps multi-command measurements of different threads from interleaving
     def GetTemperature(self):
-        self.__SensorFree.wait()  # wait for another thread (if one present) to complete operation
-        self.__SensorFree.clear()  # lock for another threads
-
-        # check if previous request was too close in time
-        curr_meas = time.time()
-        time.sleep(0.5)
-        if curr_meas - self.__prev_measured < 1:
-            time.sleep(1)
+        with self.__sensor_lock:
+            try:
+                resp = self._meas_temperature()
+                temp = np.float64(resp)
+                res = temp
+            except Exception:
+                res = 0
+                print('Error while measuring temperature')
+
+        return res
+
+    # Measures temperatures of several channels (e.g. ('A', 'B')) in one request if a device supports it.
+    # Returns a Numpy array, zeros on error (like GetTemperature)
+    def GetTemperatures(self, channels):
         try:
-            resp = self._meas_temperature()
-            temp = np.float64(resp)
-            res = temp
+            res = self.ReadTemperatures(channels)
         except Exception:
-            res = 0
-            print('Error while measuring temperature')
-
-        self.__prev_measured = time.time()
-        self.__SensorFree.set()  # unlock
+            res = np.zeros(len(channels), dtype=np.float64)
+            print('Error while measuring temperatures')
 
         return res
 
+    # The same as GetTemperatures, but raises an exception on a failed read,
+    # so a polling loop can tell a lost connection from a zero reading and reconnect
+    def ReadTemperatures(self, channels):
+        with self.__sensor_lock:
+            return np.array(self._meas_temperatures(channels), dtype=np.float64)
+
     # Number of swept temperature values
     @property
     def NumTemps(self):
@@ -176,9 +215,17 @@ class LakeShoreBase(visa_device.visa_device):
         self._verbose = verbose
         self._active = (mode == "active")
 
-        # Time from previous temperature measurement request.
-        # It is made to avoid a device to stop responding because of a buffer overflow.
-        self.__prev_measured = time.time()
+        # Last values written to a device (None - unknown), filled by _remember_old_params
+        self._pid = None
+        self._htrrng = None
+        self._excitation = None
+
+        # Sweep step settling parameters and samples, see __iter__
+        self.settle_criterion = SettleCriterion()
+        self.on_sweep_sample = None
+        self.last_step_samples = []
+
+        # Time of previous channel change, a new channel needs time to settle
         self.__prev_changed = time.time()
 
         # Load and configure a device
@@ -188,9 +235,8 @@ class LakeShoreBase(visa_device.visa_device):
         # connect to device
         super().__init__(device_num)
 
-        # Event to prevent simultaneous temperature request - it will cause an error
-        self.__SensorFree = threading.Event()
-        self.__SensorFree.set()
+        # Lock to prevent simultaneous temperature request - it will cause an error
+        self.__sensor_lock = threading.RLock()
 
         # remember current heater paramrters to restore them after program end
         self._remember_old_params()
@@ -211,12 +257,14 @@ class LakeShoreBase(visa_device.visa_device):
         if self._verbose:
             print('LakeShore bridge connection success')
 
-    # Iterate over all temperatures and set them on a device
+    # Iterate over all temperatures and set them on a device.
+    # Each step waits until the temperature settles (see settle_detector and self.settle_criterion)
+    # or a timeout expires. Samples collected while waiting are kept in self.last_step_samples
+    # and passed to self.on_sweep_sample(timestamp, temp) if it is set, so they need not be re-measured
     def __iter__(self):
         if not self._active:
             raise LakeShoreException()
 
-        tol_temp = 0.001
         for temp in self._tempValues:
             # assert temp <= 1.7, 'ERROR! Attempt to set too high temperature was made.'
             self._set_setpoint(temp)
@@ -224,46 +272,37 @@ class LakeShoreBase(visa_device.visa_device):
             # Update temperature measurement parameters depending on T
             self._update_params(temp)
 
-            actual_temp = self.GetTemperature()
             print(f'Heating... (target temperature - {temp})')
+            detector = wait_settled(self.GetTemperature, temp, self.settle_criterion, self.on_sweep_sample)
+            self.last_step_samples = detector.samples
+            actual_temp = detector.samples[-1][1]
 
-            # Wait for temperature to be established
-            c = 0
-            while abs(actual_temp - temp) >= tol_temp:
-                time.sleep(1)
-                actual_temp = self.GetTemperature()
-
-            # A temperature must be stable for 3 seconds
-            print('Temperature is set, waiting to be stable...')
-            count_ok = 0
-            while count_ok < 3:
-                time.sleep(3)
-                actual_temp = self.GetTemperature()
-                print('Now:', actual_temp, 'K, must be:', temp, 'K')
-                if abs(actual_temp - temp) <= tol_temp:
-                    count_ok += 1
-                    print('Stable', count_ok, 'times')
-                else:
-                    count_ok = 0
-                c += 1
-                if c > 50:
-                    print('Warning! Cannot set a correct temperature')
-                    break
-
-            print('Temperature was set')
+            if detector.phase == TIMEOUT:
+                print('Warning! Cannot set a correct temperature')
+            else:
+                print('Temperature was set')
 
             yield actual_temp  # last actual temperature
 
-    # class destructor - turn off a heater and free VISA resources
-    def __del__(self):
+    # turn off a heater and free VISA resources (called only once)
+    def close(self):
+        if self.device is None:
+            return
         # Turn off heater and PID control
         if self._active:
             self._set_heater_range(0)
             self._set_control_mode(PIDLoopType.off)
             self._restore_old_params()
 
+        super().close()
+
         if self._verbose:
             print('LakeShore bridge disconnected.')
             if self._active:
                 print('Heater is off.')
                 print('Old heater range parameters restored.')
+
+    # class destructor - the last resort if close() was not called
+    def __del__(self):
+        if getattr(self, 'device', None) is not None:
+            self.close()
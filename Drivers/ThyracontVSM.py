@@ -1,72 +1,236 @@
+import threading
+import time
+
 import serial
 
+from Drivers.serial_discovery import candidate_ports, load_cached_port, save_cached_port, probe_parallel
+from Simulation.cryostat_model import simulation_enabled
+from Simulation.vsm_sim import SimulatedVSM77Port, SIM_PORT_PREFIX
+from Instrumentation.metrics import instrument_commands, instrument_errors, instrument_reconnects
+
+
+# Errors of communication with a gauge: no answer, broken frame, wrong checksum
+class ThyracontError(ValueError):
+    pass
+
+
 class ThyracontVSM:
+    # Serial transport parameters
+    frame_end = b'\r'
+    max_frame_length = 64
+    read_timeout = 0.3  # maximal time to wait for a reply frame (s)
+    max_retries = 3
+    retry_backoff = 0.05  # delay before the first retry (s), doubled on each next retry
+    cache_key = 'VSM77'
+
     @staticmethod
     def _calc_checksum(s):
         sum = 0
         for ch in s:
             sum += ord(ch)
         return chr(sum % 64 + 64)
-        
-    def _read_and_write_cmd(self, cmd, length_read):
-        checksum = self._calc_checksum(cmd)
-        str_cmd = f'{cmd}{checksum}\r'
-        
-        data = bytearray(str_cmd.encode())
-        
-        while True:
-            try:
-                device = self.device
-                device.write(data)
-        
-                inp = device.read(length_read)
-                return inp.decode()
-            except UnicodeDecodeError:
-                pass  # try again
-            
-        
+
+    # Reads one frame terminated by '\r', returns it without a terminator.
+    # Returns as soon as a terminator arrives, so a short reply does not cost a whole timeout
+    def _read_frame(self, timeout=None):
+        device = self.device
+        deadline = time.monotonic() + (self.read_timeout if timeout is None else timeout)
+        data = bytearray()
+        while time.monotonic() < deadline:
+            data += device.read_until(self.frame_end, self.max_frame_length - len(data))
+            if data.endswith(self.frame_end):
+                break
+            if len(data) >= self.max_frame_length:
+                raise ThyracontError('Frame is too long')
+        else:
+            raise ThyracontError('No answer from a device')
+        try:
+            frame = data[:-1].decode('ascii')
+        except UnicodeDecodeError:
+            raise ThyracontError('Device returned a corrupted frame')
+        if len(frame) < 2 or self._calc_checksum(frame[:-1]) != frame[-1]:
+            raise ThyracontError('Invalid checksum in a device answer')
+        return frame[:-1]
+
+    # Parses a reply: address (3), access code '1', command (2), data length (2), data.
+    # Returns data
+    def _parse_reply(self, frame, cmd_name):
+        num = self.device_num
+        if not frame.startswith(f'{num:03d}1{cmd_name}'):
+            raise ThyracontError('Device returned an invalid answer')
+        try:
+            length = int(frame[6:8])
+        except ValueError:
+            raise ThyracontError('Device returned an invalid answer')
+        return frame[8:8 + length]
+
+    # Sends a command and returns data of a reply. Retries with backoff on broken or missing replies
+    def _read_and_write_cmd(self, cmd_name, data=''):
+        num = self.device_num
+        cmd = f'{num:03d}0{cmd_name}{len(data):02d}{data}'
+        str_cmd = f'{cmd}{self._calc_checksum(cmd)}\r'
+
+        with self._lock:
+            error = None
+            for attempt in range(self.max_retries):
+                if attempt > 0:
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                try:
+                    with instrument_commands.time(self.cache_key, cmd_name):
+                        device = self.device
+                        device.reset_input_buffer()  # drop rests of previous broken frames
+                        device.write(str_cmd.encode())
+                        return self._parse_reply(self._read_frame(), cmd_name)
+                except ThyracontError as e:
+                    instrument_errors.inc(self.cache_key, 'frame')
+                    error = e
+            instrument_errors.inc(self.cache_key, 'no_answer')
+            raise error
+
     def read_name(self):
-        return self._read_and_write_cmd('0010PN00', 20)
-    
+        return self._read_and_write_cmd('PN')
+
+    @staticmethod
+    def _parse_pressure(data):
+        try:
+            return float(data)
+        except ValueError:
+            raise ThyracontError('Device returned an invalid pressure value')
+
+    # Measures a pressure (mBar). In streaming mode returns the latest streamed value
     def read_pressure(self):
+        if self._stream_thread is not None:
+            return self._latest_streamed_pressure()
+        return self._parse_pressure(self._read_and_write_cmd('MV'))
+
+    # Streaming mode: a background thread parses MV frames as they arrive.
+    # poll_period - if set, the thread requests a measurement itself with this period,
+    # otherwise the gauge must be configured to send measurements continuously.
+    # max_age - read_pressure raises an error if the latest value is older (s)
+    def start_streaming(self, poll_period=None, max_age=5):
+        if self._stream_thread is not None:
+            return
+        self._stream_max_age = max_age
+        self._stream_stop.clear()
+        self._stream_thread = threading.Thread(target=self._stream_proc, args=(poll_period,),
+                                               name='vsm_stream', daemon=True)
+        self._stream_thread.start()
+
+    def stop_streaming(self):
+        if self._stream_thread is None:
+            return
+        self._stream_stop.set()
+        self._stream_thread.join()
+        self._stream_thread = None
+
+    def _stream_proc(self, poll_period):
         num = self.device_num
- 
-        read_str = self._read_and_write_cmd(f'{num:03d}0MV00', 22)
-        if not read_str.startswith(f'{num:03d}1MV'):
-            raise ValueError('Device returned an invalid answer')
-           
-        length = int(read_str[6:8])
-        press = read_str[8:8+length]
-        return float(press)
-    
-    def _detect_device(self):
-        f_found = False
-        for port in range(1, 10):
+        cmd = f'{num:03d}0MV00'
+        str_cmd = f'{cmd}{self._calc_checksum(cmd)}\r'.encode()
+        next_poll = time.monotonic()
+        while not self._stream_stop.is_set():
             try:
-                prt = f'COM{port}'
-                comport = serial.Serial(prt, timeout=0.5) 
-                comport.baudrate = 9600 
-                comport.bytesize = 8    
-                comport.parity   = 'N' 
-                comport.stopbits = 1
-                self.device = comport
+                with self._lock:
+                    if poll_period is not None and time.monotonic() >= next_poll:
+                        self.device.write(str_cmd)
+                        next_poll += poll_period
+                    frame = self._read_frame(timeout=self.read_timeout)
+                press = self._parse_pressure(self._parse_reply(frame, 'MV'))
+                self._streamed = (press, time.monotonic())
+            except ThyracontError:
+                continue  # broken frames are skipped, staleness is checked in read_pressure
             except serial.SerialException:
-                continue
-            try:
-                p = self.read_pressure()
-                n = self.read_name()
-                if 'VSM77' in n:
-                    f_found = True
-                    port_found = prt
-                    break
-            except ValueError:
-                continue
-        
-        if not f_found:
-            raise ValueError('Could not detect VSM pressure sensor')
+                self._streamed = None
+                break
+            if poll_period is not None:
+                self._stream_stop.wait(max(next_poll - time.monotonic(), 0))
+
+    def _latest_streamed_pressure(self):
+        streamed = self._streamed
+        if streamed is None or time.monotonic() - streamed[1] > self._stream_max_age:
+            raise ThyracontError('No fresh pressure values from a device')
+        return streamed[0]
+
+    # Opens a port and checks that a VSM77 answers there, returns True on success.
+    # A simulated port is opened only in simulation mode, fake pressures must never get into real logs
+    def _open_port(self, port):
+        try:
+            if port.startswith(SIM_PORT_PREFIX):
+                if not simulation_enabled():
+                    print(f'Simulated port {port} is ignored, simulation is not enabled')
+                    return False
+                comport = SimulatedVSM77Port(port, self.device_num)
+            else:
+                # exclusive: two gauges (e.g. of two cryostats) must not bind to one port
+                comport = serial.Serial(port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=0.05,
+                                        exclusive=True)
+        except (serial.SerialException, OSError):
+            return False
+        self.device = comport
+        try:
+            self.read_pressure()
+            if 'VSM77' in self.read_name():
+                return True
+        except (ThyracontError, serial.SerialException):
+            pass
+        comport.close()
+        self.device = None
+        return False
+
+    # Probes one port with a separate driver object, returns it if a gauge is there
+    @classmethod
+    def _probe_port(cls, port, device_num):
+        probe = cls.__new__(cls)
+        probe._init_state(device_num)
+        if probe._open_port(port):
+            return probe
+        return None
+
+    # Tries the last good port first, then probes all other ports in parallel
+    def _detect_device(self):
+        cached_port = load_cached_port(self.port_cache_file, self.port_cache_key)
+        found_port = None
+        if cached_port is not None and self._open_port(cached_port):
+            found_port = cached_port
         else:
-            print('VSM77 detected on port:', prt)
-    
-    def __init__(self, device_num=1):
+            ports = [p for p in candidate_ports() if p != cached_port]
+            probe = probe_parallel(ports, lambda p: self._probe_port(p, self.device_num), lambda d: d.close())
+            if probe is not None:
+                self.device = probe.device
+                found_port = probe.device.port
+
+        if found_port is None:
+            raise ValueError('Could not detect VSM pressure sensor')
+        instrument_reconnects.inc(self.cache_key)
+        print('VSM77 detected on port:', found_port)
+        # a simulated port is never remembered: the next real run would probe it first
+        if found_port != cached_port and not found_port.startswith(SIM_PORT_PREFIX):
+            save_cached_port(self.port_cache_file, self.port_cache_key, found_port)
+
+    def close(self):
+        self.stop_streaming()
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def _init_state(self, device_num):
         self.device_num = device_num
-        self._detect_device()
+        self.device = None
+        self._lock = threading.RLock()
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._streamed = None
+        self._stream_max_age = 5
+
+    # port - serial port name, if None the port is detected (the last good port is tried first)
+    # port_cache_file - file to remember the last good port in
+    # port_cache_key - a key of this gauge in the cache, unique for every gauge (e.g. of several cryostats)
+    def __init__(self, device_num=1, port=None, port_cache_file='serial_ports.cache', port_cache_key=None):
+        self._init_state(device_num)
+        self.port_cache_file = port_cache_file
+        self.port_cache_key = port_cache_key if port_cache_key is not None else self.cache_key
+        if port is not None:
+            if not self._open_port(port):
+                raise ValueError(f'Could not find VSM pressure sensor on port {port}')
+        else:
+            self._detect_device()
@@ -0,0 +1,36 @@
+# Temperature dependent controller parameters loaded from a table.
+# Every row of a table applies from its temperature up to the temperature of the next row,
+# a row for a given temperature is found by bisection.
+# Tables are YAML files (pip install pyyaml), see LakeShore335_params.yaml
+import bisect
+
+import yaml
+
+
+class ParamSchedule:
+    # rows - list of dicts with a 'temp' key (lower bound of a row, K) and parameter values
+    def __init__(self, rows):
+        if len(rows) == 0:
+            raise ValueError('Parameter schedule is empty')
+        rows = sorted(rows, key=lambda row: float(row['temp']))
+        self._temps = [float(row['temp']) for row in rows]
+        self._rows = [dict(row) for row in rows]
+        self._last_index = None  # a cache of the last found row: sweeps stay in one row for many steps
+
+    def _find(self, temp):
+        i = self._last_index
+        if i is not None and self._temps[i] <= temp and (i + 1 == len(self._temps) or temp < self._temps[i + 1]):
+            return self._rows[i]
+        i = max(bisect.bisect_right(self._temps, temp) - 1, 0)  # below the first row the first one is used
+        self._last_index = i
+        return self._rows[i]
+
+    # A value of a parameter (e.g. 'pid') for a temperature
+    def lookup(self, temp, name):
+        return self._find(temp)[name]
+
+
+def load_schedule(file_path):
+    with open(file_path, 'r') as f:
+        rows = yaml.safe_load(f)
+    return ParamSchedule(rows)
@@ -0,0 +1,115 @@
+# A per-device rate limiter for instrument commands.
+# Many instruments stop responding (input buffer overflow) if commands come too often,
+# so every command sent to a device must pass through its limiter.
+import threading
+import time
+
+
+# Token bucket: one token is refilled every min_interval seconds, up to burst tokens.
+# With burst=1 it simply guarantees min_interval seconds between the end of one command
+# and the start of the next one. It waits only when a device really needs the spacing.
+# Use as a context manager around a command: it also serialises commands from different threads.
+class RateLimiter:
+    def __init__(self, min_interval=0.0, burst=1):
+        if min_interval < 0:
+            raise ValueError('Minimal command interval must be non-negative')
+        if burst < 1:
+            raise ValueError('Burst size must be at least 1')
+        self.min_interval = min_interval
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.RLock()
+
+    def _refill(self, now):
+        if self.min_interval > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) / self.min_interval)
+        else:
+            self._tokens = float(self.burst)
+        self._last_refill = now
+
+    # Blocks until a command may be sent and takes the command lock. Returns a waited time
+    def acquire(self):
+        self._lock.acquire()
+        now = time.monotonic()
+        self._refill(now)
+        waited = 0.0
+        if self._tokens < 1:
+            waited = (1 - self._tokens) * self.min_interval
+            time.sleep(waited)
+            self._refill(time.monotonic())
+        self._tokens = max(self._tokens - 1, 0.0)
+        return waited
+
+    # Releases the command lock, spacing is counted from this moment:
+    # the time a command took gives no credit, so a slow command is still followed by a full interval
+    def release(self):
+        self._last_refill = time.monotonic()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+# Returns a limiter shared by all drivers talking to the same device address
+def get_limiter(address, min_interval=0.0, burst=1):
+    with _limiters_lock:
+        limiter = _limiters.get(address)
+        if limiter is None:
+            limiter = RateLimiter(min_interval, burst)
+            _limiters[address] = limiter
+        return limiter
+
+
+# A first-come first-served lock: threads get it in the order they asked for it,
+# so no device on a shared bus can be starved by others
+class FairLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self):
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._serving:
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self._serving += 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+_bus_locks = {}
+
+
+# A bus of a VISA address: 'GPIB0' for 'GPIB0::12::INSTR'. Devices on one bus share a FairLock
+def bus_name(address):
+    return address.split('::', 1)[0].upper()
+
+
+def get_bus_lock(address):
+    name = bus_name(address)
+    with _limiters_lock:
+        lock = _bus_locks.get(name)
+        if lock is None:
+            lock = FairLock()
+            _bus_locks[name] = lock
+        return lock
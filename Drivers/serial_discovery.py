@@ -0,0 +1,83 @@
+# Serial port discovery helpers: enumeration of real ports and a small cache of last good ports
+import glob
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from serial.tools import list_ports
+
+from Simulation.cryostat_model import simulation_enabled
+from Simulation.vsm_sim import SIM_PORT
+
+
+# Names of serial ports present in a system
+def candidate_ports():
+    ports = [p.device for p in list_ports.comports()]
+    if sys.platform.startswith('linux'):
+        for pattern in ('/dev/ttyUSB*', '/dev/ttyACM*', '/dev/ttyS*'):
+            ports += [p for p in sorted(glob.glob(pattern)) if p not in ports]
+    elif sys.platform.startswith('win') and not ports:
+        ports = [f'COM{i}' for i in range(1, 10)]
+    if simulation_enabled():
+        ports.insert(0, SIM_PORT)
+    # USB adapters first: lab gauges are usually connected through them
+    return sorted(ports, key=lambda p: 0 if ('USB' in p or 'ACM' in p or p == SIM_PORT) else 1)
+
+
+def load_cached_port(cache_file, key):
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_port(cache_file, key, port):
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[key] = port
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print('Cannot save serial port cache:', e)
+
+
+# Releases a result of a probe finished after another probe has succeeded
+def _release_late_result(release, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    res = future.result()
+    if res is not None:
+        release(res)
+
+
+# Calls probe(port) for all ports in parallel, returns the first non-None result as soon as it arrives.
+# Probes not started yet are cancelled, results of other successful probes (finished now or later)
+# are passed to release (e.g. to close ports)
+def probe_parallel(ports, probe, release=None, max_workers=8):
+    if not ports:
+        return None
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(ports)))
+    futures = [executor.submit(probe, port) for port in ports]
+    found = None
+    found_future = None
+    try:
+        for future in as_completed(futures):
+            try:
+                res = future.result()
+            except Exception:
+                continue
+            if res is not None:
+                found, found_future = res, future
+                break
+    finally:
+        for future in futures:
+            if future is not found_future and not future.cancel() and release is not None:
+                future.add_done_callback(partial(_release_late_result, release))
+        executor.shutdown(wait=False)
+    return found
@@ -0,0 +1,98 @@
+# Detection of temperature settling from a stream of samples.
+# A temperature is settled when, over the last `window` seconds, the mean is within tolerance of a target,
+# the fitted slope is small and the spread of samples is small.
+import time
+
+from Acquisition.trend import SlidingTrend
+
+APPROACH = 'approach'
+SETTLE = 'settle'
+SETTLED = 'settled'
+TIMEOUT = 'timeout'
+
+
+# Stability criterion and timeouts of a sweep step
+class SettleCriterion:
+    # tolerance - maximal |mean - target| (K)
+    # window - length of the stability window (s)
+    # max_slope - maximal |dT/dt| in the window (K/s)
+    # max_std - maximal standard deviation in the window (K)
+    # sample_period - time between temperature reads (s)
+    # approach_timeout - maximal time to reach the target (s), settle_timeout - maximal time to settle then (s)
+    def __init__(self, tolerance=0.001, window=10.0, max_slope=1e-4, max_std=5e-4, sample_period=0.5,
+                 approach_timeout=600.0, settle_timeout=300.0):
+        self.tolerance = tolerance
+        self.window = window
+        self.max_slope = max_slope
+        self.max_std = max_std
+        self.sample_period = sample_period
+        self.approach_timeout = approach_timeout
+        self.settle_timeout = settle_timeout
+
+
+class SettleDetector:
+    def __init__(self, target, criterion=None):
+        self.target = target
+        self.criterion = criterion if criterion is not None else SettleCriterion()
+        self.phase = APPROACH
+        self.samples = []  # all (timestamp, temperature) pairs of this step
+        self._trend = SlidingTrend(self.criterion.window)
+        self._phase_start = None
+
+    # Adds a sample and returns the current phase: APPROACH, SETTLE, SETTLED or TIMEOUT
+    def add(self, timestamp, temp):
+        crit = self.criterion
+        self.samples.append((timestamp, temp))
+        self._trend.add(timestamp, temp)
+        if self._phase_start is None:
+            self._phase_start = timestamp
+        elapsed = timestamp - self._phase_start
+
+        if self.phase == APPROACH:
+            if abs(temp - self.target) <= crit.tolerance:
+                self.phase = SETTLE
+                self._phase_start = timestamp
+                elapsed = 0
+            elif elapsed > crit.approach_timeout:
+                self.phase = TIMEOUT
+                return self.phase
+
+        if self.phase == SETTLE:
+            if self.is_stable():
+                self.phase = SETTLED
+            elif elapsed > crit.settle_timeout:
+                self.phase = TIMEOUT
+        return self.phase
+
+    # Windowed slope and variance test
+    def is_stable(self):
+        crit = self.criterion
+        trend = self._trend
+        if trend.span < crit.window * 0.9:  # the window must be (almost) full
+            return False
+        slope = trend.slope
+        std = trend.std
+        return abs(trend.mean - self.target) <= crit.tolerance and \
+            slope is not None and abs(slope) <= crit.max_slope and \
+            std is not None and std <= crit.max_std
+
+    @property
+    def done(self):
+        return self.phase in (SETTLED, TIMEOUT)
+
+
+# Reads temperatures with read_temperature() until settled or timed out, returns a detector with all samples.
+# on_sample(timestamp, temp) is called for every sample (e.g. to publish it to a logger)
+def wait_settled(read_temperature, target, criterion=None, on_sample=None):
+    detector = SettleDetector(target, criterion)
+    period = detector.criterion.sample_period
+    next_time = time.monotonic()
+    while not detector.done:
+        temp = read_temperature()
+        timestamp = time.time()
+        detector.add(timestamp, temp)
+        if on_sample is not None:
+            on_sample(timestamp, temp)
+        next_time += period
+        time.sleep(max(next_time - time.monotonic(), 0))
+    return detector
@@ -5,19 +5,52 @@
 import visa
 import numpy as np
 
+from Drivers.rate_limiter import get_limiter, get_bus_lock
+from Drivers.visa_pool import pool
+from Instrumentation.metrics import instrument_commands, instrument_errors, instrument_reconnects, command_name
+
 
 class visa_device:
-    def __init__(self, device_id):
-        rm = visa.ResourceManager()
+    # Minimal interval between two commands (seconds) and number of commands allowed back-to-back.
+    # Override in child classes depending on instrument model
+    min_command_interval = 0.0
+    command_burst = 1
+
+    # device_id - GPIB number or VISA address
+    # backend - VISA backend (e.g. '@sim' for pyvisa-sim), None - visa_pool.DEFAULT_BACKEND
+    def __init__(self, device_id, backend=None):
         if isinstance(device_id, int):
             device_num = int(device_id)
-            device = rm.open_resource(f"GPIB0::{device_num}::INSTR")
+            addr = f"GPIB0::{device_num}::INSTR"
         elif isinstance(device_id, str):
             addr = str(device_id)
-            device = rm.open_resource(addr)
         else:
             raise ValueError('Invalid device initialization, please provide GPIB num or device address.')
-        self.device = device
+        # sessions are taken from a process-wide pool and closed deterministically by close()
+        self.device = pool.acquire(addr, backend)
+        self.address = addr
+        # all commands to this device are spaced by a limiter shared between threads and driver instances
+        self._limiter = get_limiter(addr, self.min_command_interval, self.command_burst)
+        # commands of different devices on one bus (e.g. GPIB0) are served in order of arrival
+        self._bus_lock = get_bus_lock(addr)
+
+    # Releases a VISA session, it is closed when no other driver uses it
+    def close(self):
+        if self.device is not None:
+            self.device = None
+            pool.release(self.address)
+
+    # Opens a new session after communication errors
+    def reconnect(self):
+        with self._limiter:
+            self.device = pool.reopen(self.address)
+        instrument_reconnects.inc(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def __error_message(self):
         print('Check that device is connected, visible in NI MAX and is not used by another software.')
@@ -25,17 +58,21 @@ class visa_device:
     def SendString(self, cmd_str):
         device = self.device
         try:
-            device.write(cmd_str)
+            with self._limiter, self._bus_lock, instrument_commands.time(self.address, command_name(cmd_str)):
+                device.write(cmd_str)
         except visa.VisaIOError as e:
+            instrument_errors.inc(self.address, 'io')
             print('Unable to connect device.\n', e)
             self.__error_message()
 
     def GetString(self, cmd_str):
         device = self.device
         try:
-            resp = device.query(cmd_str)
+            with self._limiter, self._bus_lock, instrument_commands.time(self.address, command_name(cmd_str)):
+                resp = device.query(cmd_str)
             return resp
         except Exception as e:
+            instrument_errors.inc(self.address, 'io')
             print('Unable to connect device.\n', e)
             self.__error_message()
             return ""
@@ -45,12 +82,15 @@ class visa_device:
         resp = ""
 
         try:
-            resp = device.query(cmd_str)
+            with self._limiter, self._bus_lock, instrument_commands.time(self.address, command_name(cmd_str)):
+                resp = device.query(cmd_str)
             num = np.float64(resp)
             return num
         except visa.VisaIOError as e:
+            instrument_errors.inc(self.address, 'io')
             print('Unable to read data from device.\n', e)
             self.__error_message()
             return 0
         except Exception:
+            instrument_errors.inc(self.address, 'invalid_response')
             print('Device returned an invalid responce:', resp)
@@ -0,0 +1,108 @@
+# A process-wide pool of VISA resource managers and sessions.
+# A resource manager is created once per VISA backend ('' - NI-VISA, '@py' - pyvisa-py, '@sim' - pyvisa-sim)
+# and sessions are shared by address: several drivers of one device and reconnects reuse them.
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+
+import visa
+
+from Simulation.cryostat_model import simulation_enabled
+
+# A backend with simulated instruments, see Simulation/lakeshore_sim.py
+SIM_BACKEND = '@ars-sim'
+
+# VISA backend used when a driver does not specify one, e.g. VISA_BACKEND=@sim for pyvisa-sim
+DEFAULT_BACKEND = SIM_BACKEND if simulation_enabled() else os.environ.get('VISA_BACKEND', '')
+
+
+class _Session:
+    def __init__(self, resource, backend):
+        self.resource = resource
+        self.backend = backend
+        self.users = 0
+
+
+class VisaPool:
+    def __init__(self):
+        self._managers = {}  # backend: ResourceManager
+        self._sessions = {}  # address: _Session
+        self._lock = threading.RLock()
+
+    def resource_manager(self, backend=None):
+        backend = DEFAULT_BACKEND if backend is None else backend
+        with self._lock:
+            rm = self._managers.get(backend)
+            if rm is None:
+                if backend == SIM_BACKEND:
+                    from Simulation.lakeshore_sim import SimulatedResourceManager
+                    rm = SimulatedResourceManager()
+                else:
+                    rm = visa.ResourceManager(backend) if backend else visa.ResourceManager()
+                self._managers[backend] = rm
+            return rm
+
+    # Returns an open session of a device, opens it if needed. Every acquire needs a release
+    def acquire(self, address, backend=None):
+        backend = DEFAULT_BACKEND if backend is None else backend
+        with self._lock:
+            session = self._sessions.get(address)
+            if session is None:
+                resource = self.resource_manager(backend).open_resource(address)
+                session = _Session(resource, backend)
+                self._sessions[address] = session
+            session.users += 1
+            return session.resource
+
+    # Closes a session when it has no more users
+    def release(self, address):
+        with self._lock:
+            session = self._sessions.get(address)
+            if session is None:
+                return
+            session.users -= 1
+            if session.users <= 0:
+                del self._sessions[address]
+                self._close_resource(session.resource)
+
+    # Closes a (possibly broken) session and opens a new one for all its users
+    def reopen(self, address):
+        with self._lock:
+            session = self._sessions[address]
+            self._close_resource(session.resource)
+            session.resource = self.resource_manager(session.backend).open_resource(address)
+            return session.resource
+
+    @staticmethod
+    def _close_resource(resource):
+        try:
+            resource.close()
+        except Exception as e:
+            print('Error while closing VISA session:', e)
+
+    def close_all(self):
+        with self._lock:
+            for session in self._sessions.values():
+                self._close_resource(session.resource)
+            self._sessions = {}
+            for rm in self._managers.values():
+                try:
+                    rm.close()
+                except Exception as e:
+                    print('Error while closing VISA resource manager:', e)
+            self._managers = {}
+
+
+pool = VisaPool()
+atexit.register(pool.close_all)
+
+
+# A session which is released at the end of a with block
+@contextmanager
+def visa_session(address, backend=None):
+    resource = pool.acquire(address, backend)
+    try:
+        yield resource
+    finally:
+        pool.release(address)
@@ -0,0 +1,163 @@
+# Lightweight process metrics: counters, gauges and latency histograms in Prometheus text format.
+# Recording a sample is a dictionary lookup and a few additions under a lock (about a microsecond).
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets for latencies (s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_items(items)
+        return '\n'.join(lines)
+
+    def _render_items(self, items):
+        return [f'{self.name}{_format_labels(self.label_names, labels)} {value}' for labels, value in items]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        return self._values.get(labels)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    # value: [bucket counts..., +Inf count, sum]
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = [0] * (len(self.buckets) + 2)
+                self._values[labels] = data
+            data[i] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels):
+        data = self._values.get(labels)
+        return 0 if data is None else sum(data[:-1])
+
+    def _render_items(self, items):
+        lines = []
+        for labels, data in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), data[:-1]):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, ("le", le))} {cumulative}')
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_str} {data[-1]}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, label_names, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as {metric.type_name}')
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._get(Counter, name, help_text, label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._get(Gauge, name, help_text, label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, label_names, buckets=buckets)
+
+    # All metrics in Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+# A registry of the whole process
+registry = MetricsRegistry()
+
+# Metrics shared by drivers and the acquisition loop
+instrument_commands = registry.histogram('ars_instrument_command_seconds',
+                                         'Duration of instrument commands', ('device', 'command'))
+instrument_errors = registry.counter('ars_instrument_errors_total', 'Instrument communication errors',
+                                     ('device', 'kind'))
+instrument_reconnects = registry.counter('ars_instrument_reconnects_total', 'Instrument (re)connections',
+                                         ('device',))
+loop_intervals = registry.histogram('ars_loop_interval_seconds', 'Actual time between acquisition loop iterations',
+                                    ('task',))
+loop_targets = registry.gauge('ars_loop_target_period_seconds', 'Target acquisition loop period', ('task',))
+loop_overruns = registry.counter('ars_loop_overruns_total', 'Acquisition loop iterations longer than the period',
+                                 ('task',))
+task_connects = registry.counter('ars_task_connects_total', 'Successful connects of acquisition tasks', ('task',))
+task_errors = registry.counter('ars_task_errors_total', 'Failed reads of acquisition tasks', ('task', 'kind'))
+log_flushes = registry.histogram('ars_log_flush_seconds', 'Duration of log file flushes')
+
+
+# The first word of a command is used as a label, e.g. 'KRDG?' for 'KRDG? A'
+def command_name(cmd_str):
+    return cmd_str.split(' ', 1)[0].strip()
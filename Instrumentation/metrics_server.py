@@ -0,0 +1,45 @@
+# A local HTTP endpoint exposing metrics in Prometheus text format at /metrics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Instrumentation.metrics import registry as default_registry
+
+
+def _make_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # do not print every scrape
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    # By default only local connections are accepted
+    def __init__(self, port=9337, host='127.0.0.1', registry=None):
+        handler = _make_handler(registry if registry is not None else default_registry)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics_server', daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
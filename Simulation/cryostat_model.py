@@ -0,0 +1,115 @@
+# A simple physical model of a cryostat for instrument simulators.
+# Channel B is a cold head, channel A a sample stage. Both relax exponentially to the target of the
+# current mode (cooldown to base temperature, warmup to room temperature), the control channel
+# follows the setpoint when a closed PID loop with a non-zero heater range is on.
+# Pressure follows the cold head temperature (cryopumping).
+import math
+import os
+import random
+import threading
+import time
+
+ROOM_TEMPERATURE = 295.0
+
+# Set ARS_SIMULATION=1 to run the logger with simulated instruments
+SIMULATION_ENV = 'ARS_SIMULATION'
+
+
+def simulation_enabled():
+    return os.environ.get(SIMULATION_ENV, '') not in ('', '0')
+
+
+# Latency, jitter and dropouts of a simulated device
+class LinkParams:
+    # latency - mean reply delay (s), jitter - standard deviation of the delay (s)
+    # dropout - probability of no reply, corruption - probability of a damaged reply
+    def __init__(self, latency=0.02, jitter=0.005, dropout=0.0, corruption=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.dropout = dropout
+        self.corruption = corruption
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def dropped(self):
+        return random.random() < self.dropout
+
+    def corrupted(self):
+        return random.random() < self.corruption
+
+
+class CryostatModel:
+    # base_temps - base temperatures of channels A and B (K)
+    # tau - cooldown/warmup time constant (s), control_tau - time constant of setpoint control (s)
+    # speed - time acceleration factor (e.g. 100 to simulate a cooldown in minutes)
+    # noise - relative noise of temperature readings
+    def __init__(self, mode='stable', base_temps=(4.0, 3.5), tau=7200.0, control_tau=60.0, speed=1.0,
+                 noise=1e-4, start_temps=None):
+        self.mode = mode
+        self.base_temps = {'A': base_temps[0], 'B': base_temps[1]}
+        self.tau = tau
+        self.control_tau = control_tau
+        self.speed = speed
+        self.noise = noise
+        if start_temps is None:
+            start_temps = base_temps if mode == 'stable' else (ROOM_TEMPERATURE, ROOM_TEMPERATURE)
+        self._temps = {'A': float(start_temps[0]), 'B': float(start_temps[1])}
+        self.setpoint = None
+        self.control_channel = 'A'
+        self.closed_loop = False
+        self.heater_range = 0
+        self._last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    # mode: 'cooldown', 'warmup' or 'stable'
+    def set_mode(self, mode):
+        with self._lock:
+            self._update()
+            self.mode = mode
+
+    def _target(self, chan):
+        if self.closed_loop and self.heater_range > 0 and chan == self.control_channel and \
+                self.setpoint is not None:
+            return self.setpoint, self.control_tau
+        if self.mode == 'cooldown':
+            return self.base_temps[chan], self.tau
+        if self.mode == 'warmup':
+            return ROOM_TEMPERATURE, self.tau
+        return self._temps[chan], self.tau
+
+    def _update(self):
+        now = time.monotonic()
+        dt = (now - self._last_update) * self.speed
+        self._last_update = now
+        for chan in self._temps:
+            target, tau = self._target(chan)
+            self._temps[chan] += (target - self._temps[chan]) * (1 - math.exp(-dt / tau))
+
+    def temperature(self, chan):
+        with self._lock:
+            self._update()
+            temp = self._temps[chan]
+        return temp * (1 + random.gauss(0, self.noise))
+
+    # Pressure in mBar
+    def pressure(self):
+        with self._lock:
+            self._update()
+            temp = self._temps['B']
+        return (1e-7 + 1e-3 * (temp / ROOM_TEMPERATURE) ** 4) * (1 + random.gauss(0, 0.01))
+
+
+_default_model = None
+_default_model_lock = threading.Lock()
+
+
+# A model shared by all simulators of a process, so pressure follows simulated temperatures
+def default_model():
+    global _default_model
+    with _default_model_lock:
+        if _default_model is None:
+            mode = os.environ.get('ARS_SIMULATION_MODE', 'cooldown')
+            speed = float(os.environ.get('ARS_SIMULATION_SPEED', '1'))
+            _default_model = CryostatModel(mode=mode, speed=speed)
+        return _default_model
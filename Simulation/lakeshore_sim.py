@@ -0,0 +1,96 @@
+# A simulated LakeShore 335 which plugs into visa_device instead of a VISA session
+import threading
+import time
+
+import visa
+
+from Simulation.cryostat_model import LinkParams, default_model
+
+
+class SimulatedLakeShore335:
+    inputs = ('A', 'B')
+
+    def __init__(self, model=None, link=None):
+        self.model = model if model is not None else default_model()
+        self.link = link if link is not None else LinkParams()
+        self.timeout = 2000  # ms, like a pyvisa resource
+        self._intype = {chan: [1, 0, 1, 0, 1] for chan in self.inputs}
+        self._pid = {1: '50.0,20.0,0.0', 2: '50.0,20.0,0.0'}
+        self._range = {1: 0, 2: 0}
+        self._cmode = 4
+        self._lock = threading.Lock()  # a real device handles one command at a time
+
+    def _transfer(self):
+        time.sleep(self.link.delay())
+        if self.link.dropped():
+            time.sleep(self.timeout / 1000)
+            raise visa.VisaIOError(visa.constants.VI_ERROR_TMO)
+
+    def write(self, cmd):
+        with self._lock:
+            self._transfer()
+            self._handle(cmd.strip())
+
+    def query(self, cmd):
+        with self._lock:
+            self._transfer()
+            resp = self._handle(cmd.strip())
+        if self.link.corrupted():
+            resp = resp[:len(resp) // 2]
+        return resp + '\r\n'
+
+    def close(self):
+        pass
+
+    def _reading(self, chan):
+        return f'{self.model.temperature(chan):+.4f}'
+
+    def _handle(self, cmd):
+        name, _, args = cmd.partition(' ')
+        args = [a.strip() for a in args.split(',')] if args else []
+        model = self.model
+        if name == '*IDN?':
+            return 'LSCI,MODEL335,SIMULATED,1.0'
+        if name == 'KRDG?':
+            if args[0] == '0':
+                return ','.join(self._reading(chan) for chan in self.inputs)
+            return self._reading(args[0])
+        if name == 'INTYPE?':
+            return ','.join(str(v) for v in self._intype[args[0]])
+        if name == 'INTYPE':
+            self._intype[args[0]] = [int(v) for v in args[1:6]]
+            return ''
+        if name == 'PID?':
+            return self._pid[int(args[0])]
+        if name == 'PID':
+            self._pid[int(args[0])] = ','.join(args[1:4])
+            return ''
+        if name == 'SETP':
+            model.setpoint = float(args[-1])
+            return ''
+        if name == 'SETP?':
+            return f'{model.setpoint or 0:+.4f}'
+        if name == 'CMODE':
+            self._cmode = int(args[-1])
+            model.closed_loop = (self._cmode == 1)
+            return ''
+        if name == 'RANGE':
+            self._range[int(args[0])] = int(args[1])
+            model.heater_range = self._range[1]
+            return ''
+        if name == 'RANGE?':
+            return str(self._range[int(args[0])])
+        return ''
+
+
+# A resource manager for visa_pool: every address gets a simulated LakeShore 335
+class SimulatedResourceManager:
+    def __init__(self, model=None, link=None):
+        self.model = model
+        self.link = link
+
+    def open_resource(self, address):
+        return SimulatedLakeShore335(self.model, self.link)
+
+    def close(self):
+        pass
@@ -0,0 +1,81 @@
+# A simulated Thyracont VSM77 serial port for ThyracontVSM
+import threading
+import time
+
+from Simulation.cryostat_model import LinkParams, default_model
+
+SIM_PORT_PREFIX = 'sim://'
+SIM_PORT = SIM_PORT_PREFIX + 'vsm77'
+
+
+def _checksum(s):
+    return chr(sum(ord(ch) for ch in s) % 64 + 64)
+
+
+# Implements the part of a pyserial port used by ThyracontVSM
+class SimulatedVSM77Port:
+    def __init__(self, port=SIM_PORT, device_num=1, model=None, link=None, timeout=0.05):
+        self.port = port
+        self.device_num = device_num
+        self.model = model if model is not None else default_model()
+        self.link = link if link is not None else LinkParams(latency=0.01, jitter=0.002)
+        self.timeout = timeout
+        self._pending = []  # [(time when available, bytes)]
+        self._lock = threading.Lock()
+        self.is_open = True
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._pending = []
+
+    def write(self, data):
+        frame = bytes(data).decode('ascii').rstrip('\r')
+        body, checksum = frame[:-1], frame[-1:]
+        if checksum != _checksum(body) or not body.startswith(f'{self.device_num:03d}0'):
+            return len(data)
+        reply = self._reply(body[4:6])
+        if reply is None or self.link.dropped():
+            return len(data)
+        reply = f'{self.device_num:03d}1{body[4:6]}{len(reply):02d}{reply}'
+        reply = (reply + _checksum(reply) + '\r').encode('ascii')
+        if self.link.corrupted():
+            reply = b'\xff' + reply[1:]
+        with self._lock:
+            self._pending.append((time.monotonic() + self.link.delay(), reply))
+        return len(data)
+
+    def _reply(self, cmd):
+        if cmd == 'MV':
+            return f'{self.model.pressure():.4E}'
+        if cmd == 'PN':
+            return 'VSM77DL'
+        return None
+
+    # Bytes available now, up to size, stopping after expected
+    def _take(self, expected, size):
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending or self._pending[0][0] > now:
+                return b''
+            available_at, data = self._pending[0]
+            end = data.find(expected)
+            n = min(size, end + len(expected) if end >= 0 else len(data))
+            out, rest = data[:n], data[n:]
+            if rest:
+                self._pending[0] = (available_at, rest)
+            else:
+                self._pending.pop(0)
+            return out
+
+    def read_until(self, expected=b'\n', size=None):
+        deadline = time.monotonic() + self.timeout
+        size = size if size is not None else 1 << 16
+        out = b''
+        while True:
+            out += self._take(expected, size - len(out))
+            if out.endswith(expected) or len(out) >= size or time.monotonic() >= deadline:
+                return out
+            time.sleep(0.001)
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,311 @@
+# A local SQLite archive of all logged samples with absolute timestamps.
+#
+# Text logs keep only 'HH-MM-SS' and need a day directory to be understood; the archive stores
+# every sample as (series, time, value) with Unix time, indexed by series and time, so range
+# queries and questions like "all periods below 4 K last year" take milliseconds.
+#
+# An existing Logs/ tree is imported with import_logs(): files are parsed in parallel by a process
+# pool and inserted by one writer in batched transactions (SQLite has a single writer, WAL mode lets
+# readers work meanwhile). The logger ingests newly flushed records with ingest_file(), only bytes
+# appended since the previous ingest are parsed.
+#
+#   python -m Storage.archive Logs                       # import (or update) Logs/archive.sqlite
+#   python -m Storage.archive Logs --below 4 --channel A # periods below 4 K
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+
+import numpy as np
+
+from Storage import binary_log
+from Storage.log_index import _log_day, _parse_text_lines
+from Storage.rollups import DEFAULT_TIERS
+
+ARCHIVE_FILE_NAME = 'archive.sqlite'
+# channel names of text logs, which have no header
+DEFAULT_TEXT_CHANNELS = {'Temperature': ('A', 'B'), 'Pressure': ('P',)}
+BATCH_RECORDS = 10000
+_ROLLUP_TIERS = {tier for tier, _ in DEFAULT_TIERS}
+
+# A sample is identified by its source file and the byte offset of its record, so samples with equal times
+# (text logs have 1 s resolution) are all kept, and a record ingested twice is stored once
+SCHEMA_VERSION = 2
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    log_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    UNIQUE (log_name, channel)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    series_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    source_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, time, source_id, offset)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingested_files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    last_time REAL
+);
+'''
+_TABLES = ('series', 'samples', 'ingested_files')
+
+
+# Reads records of a log file appended after offset, returns (columns, times, values, record offsets, new offset).
+# columns is None for text logs. prev_time is a time of the last record before offset (midnight wrap).
+# A module-level function to be run in worker processes.
+def read_new_records(file_path, offset=0, prev_time=None):
+    if file_path.endswith('.bin'):
+        with open(file_path, 'rb') as f:
+            columns, header_size = binary_log.decode_header(f)
+            record_size = 8 * len(columns)
+            start = max(offset, header_size)
+            f.seek(0, os.SEEK_END)
+            n_records = (f.tell() - start) // record_size
+            if n_records <= 0:
+                return columns[1:], [], [], [], start
+            f.seek(start)
+            data = np.frombuffer(f.read(n_records * record_size), dtype='<f8').reshape(n_records, len(columns))
+        offsets = list(range(start, start + n_records * record_size, record_size))
+        return columns[1:], data[:, 0].tolist(), data[:, 1:].tolist(), offsets, start + n_records * record_size
+
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1  # only complete lines
+    day = _log_day(file_path)
+    times = []
+    values = []
+    offsets = []
+    line_offset = offset
+    for line in data[:end].splitlines(keepends=True):
+        line_times, line_values = _parse_text_lines([line.decode(errors='replace')], day, prev_time)
+        if line_times:
+            prev_time = line_times[0]
+            times.append(line_times[0])
+            values.append(line_values[0])
+            offsets.append(line_offset)
+        line_offset += len(line)
+    return None, times, values, offsets, offset + end
+
+
+def log_name_of(file_path):
+    return path.splitext(path.basename(file_path))[0]
+
+
+class SampleArchive:
+    def __init__(self, db_path, text_channels=None):
+        self.db_path = db_path
+        self.text_channels = dict(DEFAULT_TEXT_CHANNELS)
+        self.text_channels.update(text_channels or {})
+        self._lock = threading.Lock()
+        # one connection used under a lock: ingest runs in the log writer thread, queries anywhere
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            # an archive of an older layout is rebuilt from the logs
+            for table in _TABLES:
+                self._db.execute(f'DROP TABLE IF EXISTS {table}')
+            self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._db.executescript(_SCHEMA)
+        self._series = {(log_name, channel): series_id for series_id, log_name, channel
+                        in self._db.execute('SELECT id, log_name, channel FROM series')}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _series_id(self, log_name, channel):
+        key = (log_name, channel)
+        series_id = self._series.get(key)
+        if series_id is None:
+            series_id = self._db.execute('INSERT INTO series (log_name, channel) VALUES (?, ?)', key).lastrowid
+            self._series[key] = series_id
+        return series_id
+
+    def _channels(self, log_name, columns, n_values):
+        if columns is None:
+            columns = self.text_channels.get(log_name, ())
+        return tuple(columns) + tuple(f'c{i}' for i in range(len(columns), n_values))
+
+    # Returns (source id, ingested size, time of the last ingested record) of a file.
+    # Samples of a file which became shorter (rewritten) are deleted, it is ingested again
+    def _file_state(self, file_path):
+        row = self._db.execute('SELECT id, size, last_time FROM ingested_files WHERE path = ?',
+                               (file_path,)).fetchone()
+        if row is None:
+            with self._db:
+                source_id = self._db.execute('INSERT INTO ingested_files (path, size) VALUES (?, 0)',
+                                             (file_path,)).lastrowid
+            return source_id, 0, None
+        source_id, size, last_time = row
+        if size > path.getsize(file_path):
+            with self._db:
+                self._db.execute('DELETE FROM samples WHERE source_id = ?', (source_id,))
+                self._db.execute('UPDATE ingested_files SET size = 0, last_time = NULL WHERE id = ?', (source_id,))
+            return source_id, 0, None
+        return row
+
+    # Inserts parsed records and remembers how far the file was read, in one transaction
+    def _store(self, source_id, file_path, columns, times, values, offsets, new_offset):
+        log_name = log_name_of(file_path)
+        rows = []
+        for t, record, offset in zip(times, values, offsets):
+            channels = self._channels(log_name, columns, len(record))
+            rows.extend((self._series_id(log_name, channel), t, source_id, offset, v)
+                        for channel, v in zip(channels, record))
+        for i in range(0, len(rows), BATCH_RECORDS):
+            self._db.executemany('INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?, ?)', rows[i:i + BATCH_RECORDS])
+        if times:
+            self._db.execute('UPDATE ingested_files SET size = ?, last_time = ? WHERE id = ? AND size < ?',
+                             (new_offset, times[-1], source_id, new_offset))
+        else:
+            self._db.execute('UPDATE ingested_files SET size = ? WHERE id = ? AND size < ?',
+                             (new_offset, source_id, new_offset))
+
+    # Adds records appended to a log file since the previous ingest
+    def ingest_file(self, file_path):
+        file_path = path.abspath(file_path)
+        with self._lock:
+            source_id, offset, prev_time = self._file_state(file_path)
+            columns, times, values, offsets, new_offset = read_new_records(file_path, offset, prev_time)
+            if new_offset == offset:
+                return 0
+            with self._db:
+                self._store(source_id, file_path, columns, times, values, offsets, new_offset)
+        return len(times)
+
+    # Imports new files and appended records of a Logs/ tree: files are parsed in parallel
+    # by a process pool, records are inserted here file by file. Returns a number of imported records.
+    # Setting stop_event cancels files not parsed yet, they are imported next time.
+    def import_logs(self, logs_dir, log_names=None, workers=None, stop_event=None):
+        jobs = []
+        with self._lock:
+            for file_path in archived_log_files(logs_dir, log_names):
+                file_path = path.abspath(file_path)
+                source_id, offset, prev_time = self._file_state(file_path)
+                if offset < path.getsize(file_path):
+                    jobs.append((source_id, file_path, offset, prev_time))
+        if not jobs:
+            return 0
+
+        n_records = 0
+        # spawn: forking a process with running acquisition threads may copy held locks
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [(source_id, file_path, executor.submit(read_new_records, file_path, offset, prev_time))
+                       for source_id, file_path, offset, prev_time in jobs]
+            for source_id, file_path, future in futures:
+                if stop_event is not None and stop_event.is_set():
+                    for _, _, pending in futures:
+                        pending.cancel()
+                    break
+                try:
+                    columns, times, values, offsets, new_offset = future.result()
+                except (ValueError, OSError) as e:
+                    print(f'Cannot archive {file_path}:', e)
+                    continue
+                with self._lock, self._db:
+                    self._store(source_id, file_path, columns, times, values, offsets, new_offset)
+                n_records += len(times)
+        return n_records
+
+    # Samples of one channel as (times, values) arrays
+    def query(self, log_name, channel, t_start=None, t_end=None):
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT time, value FROM samples JOIN series ON series.id = series_id '
+                'WHERE log_name = ? AND channel = ? AND time >= ? AND time <= ? ORDER BY time',
+                (log_name, channel, -np.inf if t_start is None else t_start,
+                 np.inf if t_end is None else t_end)).fetchall()
+        data = np.array(rows, dtype=float).reshape(-1, 2)
+        return data[:, 0], data[:, 1]
+
+    # Periods when a channel stayed below a threshold, e.g. cooldowns below 4 K:
+    # a list of (t_first, t_last, minimal value). Samples more than max_gap seconds apart
+    # (the channel was above the threshold or not logged) belong to different periods.
+    def periods_below(self, log_name, channel, threshold, t_start=None, t_end=None, max_gap=600):
+        with self._lock:
+            return self._db.execute('''
+                WITH below AS (
+                    SELECT time, value, time - LAG(time) OVER (ORDER BY time) AS gap
+                    FROM samples JOIN series ON series.id = series_id
+                    WHERE log_name = ? AND channel = ? AND time >= ? AND time <= ? AND value < ?
+                ), numbered AS (
+                    SELECT time, value, SUM(CASE WHEN gap IS NULL OR gap > ? THEN 1 ELSE 0 END)
+                        OVER (ORDER BY time) AS period
+                    FROM below
+                )
+                SELECT MIN(time), MAX(time), MIN(value) FROM numbered GROUP BY period ORDER BY period
+                ''', (log_name, channel, -np.inf if t_start is None else t_start,
+                      np.inf if t_end is None else t_end, threshold, max_gap)).fetchall()
+
+
+# Log files of a tree to be archived: binary logs (full time resolution), or text logs of days without
+# a binary one (the 'both' format writes the same samples twice). Rollup files are not archived.
+def archived_log_files(logs_dir, log_names=None):
+    res = []
+    for day in sorted(os.listdir(logs_dir)):
+        day_dir = path.join(logs_dir, day)
+        if not path.isdir(day_dir):
+            continue
+        names = sorted(os.listdir(day_dir))
+        for file_name in names:
+            log_name, ext = path.splitext(file_name)
+            if log_names is not None and log_name not in log_names:
+                continue
+            if (ext == '.bin' and log_name.rsplit('_', 1)[-1] not in _ROLLUP_TIERS) or \
+                    (ext == '.log' and log_name + '.bin' not in names):
+                res.append(path.join(day_dir, file_name))
+    return res
+
+
+# Imports (or updates) an archive from a Logs/ tree, see SampleArchive.import_logs
+def import_logs(logs_dir, db_path=None, log_names=None, workers=None, text_channels=None):
+    archive = SampleArchive(db_path if db_path is not None else path.join(logs_dir, ARCHIVE_FILE_NAME),
+                            text_channels)
+    try:
+        return archive.import_logs(logs_dir, log_names, workers)
+    finally:
+        archive.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import logs into an SQLite archive and query it')
+    parser.add_argument('logs_dir')
+    parser.add_argument('--db', help=f'archive file, default: LOGS_DIR/{ARCHIVE_FILE_NAME}')
+    parser.add_argument('--workers', type=int, help='parser processes, default: number of CPUs')
+    parser.add_argument('--below', type=float, help='list periods when a channel was below this value')
+    parser.add_argument('--log', default='Temperature', help='log name for --below')
+    parser.add_argument('--channel', default='A', help='channel for --below')
+    parser.add_argument('--days', type=float, default=365, help='look back this many days for --below')
+    args = parser.parse_args(argv)
+    db_path = args.db if args.db is not None else path.join(args.logs_dir, ARCHIVE_FILE_NAME)
+
+    t0 = time.perf_counter()
+    n_records = import_logs(args.logs_dir, db_path, workers=args.workers)
+    print(f'Imported {n_records} records in {time.perf_counter() - t0:.1f} s')
+
+    if args.below is not None:
+        archive = SampleArchive(db_path)
+        t0 = time.perf_counter()
+        periods = archive.periods_below(args.log, args.channel, args.below, time.time() - args.days * 86400)
+        elapsed = time.perf_counter() - t0
+        for t_first, t_last, min_value in periods:
+            print(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t_first))} - '
+                  f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t_last))}  min {min_value:g}')
+        print(f'{len(periods)} periods found in {elapsed * 1000:.1f} ms')
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# Append-only binary log format and a memory-mapped reader.
+#
+# File layout:
+#   header: magic (8 bytes), header size (uint32), number of columns (uint32),
+#           column names (16 bytes each, ASCII, zero padded), zero padding up to a multiple of 8 bytes
+#   records: fixed-width little-endian float64 values: timestamp (Unix time, s), then one value per channel
+#
+# Records have a fixed width, so a file can be memory-mapped as a Numpy structured array
+# and every column is available as a view without copying or parsing.
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+from os import path
+
+import numpy as np
+
+MAGIC = b'ARSLOG1\0'
+TIME_COLUMN = 'time'
+_NAME_SIZE = 16
+_FIXED_HEADER = struct.Struct('<8sII')
+
+
+def encode_header(channels):
+    columns = [TIME_COLUMN] + list(channels)
+    names = b''
+    for name in columns:
+        encoded = name.encode('ascii')
+        if len(encoded) > _NAME_SIZE:
+            raise ValueError(f'Column name is too long: {name}')
+        names += encoded.ljust(_NAME_SIZE, b'\0')
+    size = _FIXED_HEADER.size + len(names)
+    size += -size % 8
+    header = _FIXED_HEADER.pack(MAGIC, size, len(columns)) + names
+    return header.ljust(size, b'\0')
+
+
+# Reads a header from a file object, returns (column names, header size)
+def decode_header(f):
+    fixed = f.read(_FIXED_HEADER.size)
+    if len(fixed) < _FIXED_HEADER.size:
+        raise ValueError('Binary log header is truncated')
+    magic, size, n_columns = _FIXED_HEADER.unpack(fixed)
+    if magic != MAGIC:
+        raise ValueError('Not an ARS binary log file')
+    names = f.read(n_columns * _NAME_SIZE)
+    columns = [names[i * _NAME_SIZE:(i + 1) * _NAME_SIZE].rstrip(b'\0').decode('ascii') for i in range(n_columns)]
+    return columns, size
+
+
+def record_dtype(columns):
+    return np.dtype([(name, '<f8') for name in columns])
+
+
+# Packs one record, values in the order of channels
+def encode_record(timestamp, values):
+    return np.array([timestamp] + [np.nan if v is None else v for v in values], dtype='<f8').tobytes()
+
+
+# Appends records to a binary log, creating a file with a header if needed
+class BinaryLogWriter:
+    def __init__(self, file_path, channels):
+        self.file_path = file_path
+        self.channels = list(channels)
+        header = encode_header(self.channels)
+        if path.isfile(file_path) and path.getsize(file_path) > 0:
+            with open(file_path, 'rb') as f:
+                columns, _ = decode_header(f)
+            if columns[1:] != self.channels:
+                raise ValueError(f'{file_path} has different channels: {columns[1:]}')
+            self._f = open(file_path, 'ab')
+            self._truncate_partial_record(len(header))
+        else:
+            self._f = open(file_path, 'ab')
+            self._f.write(header)
+
+    # A crash during a write may leave a partial record at the end, drop it to keep records aligned
+    def _truncate_partial_record(self, header_size):
+        size = path.getsize(self.file_path)
+        record_size = 8 * (len(self.channels) + 1)
+        extra = (size - header_size) % record_size
+        if extra:
+            self._f.truncate(size - extra)
+
+    def append(self, timestamp, values):
+        self._f.write(encode_record(timestamp, values))
+
+    def flush(self):
+        self._f.flush()
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
+
+
+# Memory-maps a binary log, returns a structured Numpy array (read-only, no copy).
+# Columns are accessed by name: data['time'], data['A'], ...
+def open_log(file_path):
+    with open(file_path, 'rb') as f:
+        columns, header_size = decode_header(f)
+    dtype = record_dtype(columns)
+    n_records = (path.getsize(file_path) - header_size) // dtype.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode='r', offset=header_size, shape=(n_records,))
+
+
+# Returns records of one file with t_start <= time < t_end (a view, timestamps are increasing)
+def slice_time_range(data, t_start=None, t_end=None):
+    times = data[TIME_COLUMN]
+    i_start = 0 if t_start is None else np.searchsorted(times, t_start, side='left')
+    i_end = len(data) if t_end is None else np.searchsorted(times, t_end, side='left')
+    return data[i_start:i_end]
+
+
+# Day directories (Logs/YYYY-MM-DD) which may contain records between t_start and t_end
+def day_directories(logs_dir, t_start, t_end):
+    day = datetime.fromtimestamp(t_start).date()
+    last_day = datetime.fromtimestamp(t_end).date()
+    while day <= last_day:
+        yield path.join(logs_dir, day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+
+
+# Reads records of a log (e.g. 'Temperature.bin') from all day directories between t_start and t_end.
+# The result is a view if only one file is involved, otherwise the slices are concatenated
+def read_time_range(logs_dir, file_name, t_start, t_end):
+    parts = []
+    for day_dir in day_directories(logs_dir, t_start, t_end):
+        file_path = path.join(day_dir, file_name)
+        if path.isfile(file_path):
+            part = slice_time_range(open_log(file_path), t_start, t_end)
+            if len(part) > 0:
+                parts.append(part)
+    if len(parts) == 0:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate(parts)
+
+
+# Exports a binary log to the text format used by the logger: 'HH-MM-SS value1 value2 ...'
+def export_text(binary_path, text_path):
+    data = open_log(binary_path)
+    channels = data.dtype.names[1:]
+    with open(text_path, 'w') as f:
+        for record in data:
+            time_str = time.strftime('%H-%M-%S', time.localtime(record[TIME_COLUMN]))
+            values = ' '.join(str(record[chan]) for chan in channels)
+            f.write(f'{time_str} {values}\n')
+
+
+# Exports all binary logs of a logs directory which have no text counterpart yet
+def export_all_text(logs_dir, binary_name, text_name):
+    for day in sorted(os.listdir(logs_dir)):
+        binary_path = path.join(logs_dir, day, binary_name)
+        text_path = path.join(logs_dir, day, text_name)
+        if path.isfile(binary_path) and not path.isfile(text_path):
+            export_text(binary_path, text_path)
@@ -0,0 +1,40 @@
+# Day directories of a logs tree: Logs/YYYY-MM-DD/.
+# A directory is chosen by a record's own timestamp, so records land in the right day no matter
+# when a logging loop runs, and late records (e.g. flushed after midnight) go to their own day.
+# Bounds of the current local day are cached: for almost every record a lookup is two comparisons.
+# Bounds are computed by mktime of local midnights, so 23 and 25 hour days of DST changes are right;
+# a timestamp outside of the cached day (a new day or a clock jump either way) recomputes them.
+# Only paths are computed here, with no file system access: this runs in acquisition loops, and directories
+# are created by the log writer thread when it opens a file, so a stalled share never blocks acquisition.
+import time
+from os import path
+
+
+def local_day_bounds(timestamp):
+    tm = time.localtime(timestamp)
+    start = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday + 1, 0, 0, 0, 0, 0, -1))  # mktime normalizes a day
+    return start, end, time.strftime('%Y-%m-%d', tm)
+
+
+class DayDirectories:
+    def __init__(self, logs_root):
+        self.logs_root = logs_root
+        self._current = (0.0, 0.0, None)  # (day start, next day start, directory), replaced as a whole
+
+    # Directory of a day containing timestamp (now if None)
+    def directory(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        start, end, directory = self._current
+        if start <= timestamp < end:
+            return directory
+        start, end, day = local_day_bounds(timestamp)
+        directory = path.join(self.logs_root, day)
+        # the cache follows the wall clock (a new day or a clock jump), not late records
+        if start <= time.time() < end:
+            self._current = (start, end, directory)
+        return directory
+
+    def path(self, file_name, timestamp=None):
+        return path.join(self.directory(timestamp), file_name)
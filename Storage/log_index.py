@@ -0,0 +1,255 @@
+# A time index over the Logs/ directory tree and a time-range query API.
+#
+# Every log file (text 'HH-MM-SS v1 v2 ...' or binary, see binary_log) is split into blocks
+# of block_records records. For each block the index keeps the first and the last timestamp,
+# a byte offset and a byte length, so a time-range query reads only the relevant bytes.
+# The index is updated incrementally: only bytes appended since the previous update are parsed.
+# It is persisted as a snapshot (index.json) and a journal of changes since it (index.journal): a save appends
+# only blocks changed since the previous one, the journal is folded into the snapshot when it grows large.
+# Lines of text logs which cannot be parsed (e.g. torn by a crash) are skipped.
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from os import path
+
+import numpy as np
+
+from Storage import binary_log
+
+INDEX_FILE_NAME = 'index.json'
+JOURNAL_SUFFIX = '.journal'
+_HALF_DAY = 12 * 3600
+
+
+# Parses 'HH-MM-SS' of a log in a directory of date day (year, month, day), next_day - the line was written
+# after midnight. Local time is converted by mktime, so times of days with a DST change are right
+def _parse_text_time(time_str, day, next_day=False):
+    hours, minutes, seconds = time_str.split('-')
+    return time.mktime((day[0], day[1], day[2] + next_day, int(hours), int(minutes), int(seconds), 0, 0, -1))
+
+
+def _log_day(file_path):
+    day = datetime.strptime(path.basename(path.dirname(file_path)), '%Y-%m-%d')
+    return day.year, day.month, day.day
+
+
+# Parses text log lines, returns (times, values). prev_time is a time of a line before these ones:
+# a line written after midnight into yesterday's file has a smaller time, it belongs to the next day then
+def _parse_text_lines(lines, day, prev_time=None):
+    times = []
+    values = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        try:
+            t = _parse_text_time(fields[0], day)
+            if prev_time is not None and t < prev_time - _HALF_DAY:
+                t = _parse_text_time(fields[0], day, next_day=True)
+            line_values = [float(v) for v in fields[1:]]
+        except ValueError:
+            continue
+        prev_time = t
+        times.append(t)
+        values.append(line_values)
+    return times, values
+
+
+class LogIndex:
+    # journal_bytes - the journal is folded into the snapshot when it is larger
+    def __init__(self, logs_dir, block_records=1024, index_file=None, journal_bytes=4 * 1024 * 1024):
+        self.logs_dir = logs_dir
+        self.block_records = block_records
+        self.index_file = index_file if index_file is not None else path.join(logs_dir, INDEX_FILE_NAME)
+        self.journal_file = self.index_file + JOURNAL_SUFFIX
+        self.journal_bytes = journal_bytes
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # relative file path: {'size': indexed bytes, 'blocks': [[t_first, t_last, offset, length, n_records]]}
+        self._files = {}
+        self._changed = {}  # relative file path: index of the first block changed since the previous save
+        if path.isfile(self.index_file):
+            with open(self.index_file, 'r') as f:
+                stored = json.load(f)
+            if stored.get('block_records') == block_records:
+                self._files = stored['files']
+                self._replay_journal()
+        # nothing is written here (a reader may open the index of a running logger): the first save writes
+        # a snapshot with the journal folded in, later saves append to a journal continuing it
+        self._snapshot_pending = True
+
+    # Applies changes saved after the snapshot. A torn last line (a crash during a save) is ignored.
+    # Entries are idempotent, so a journal already folded into the snapshot can be replayed again
+    def _replay_journal(self):
+        if not path.isfile(self.journal_file):
+            return
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    rel_path, size, first_block, blocks = json.loads(line)
+                except ValueError:
+                    break
+                entry = self._files.setdefault(rel_path, {'size': 0, 'blocks': []})
+                entry['size'] = size
+                entry['blocks'][first_block:] = blocks
+
+    def _write_snapshot(self):
+        os.makedirs(path.dirname(self.index_file), exist_ok=True)
+        with self._lock:
+            data = json.dumps({'block_records': self.block_records, 'files': self._files})
+            self._changed.clear()
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+        os.replace(tmp_file, self.index_file)
+        with open(self.journal_file, 'w'):
+            pass
+
+    # Appends blocks changed since the previous save to the journal
+    def save(self):
+        with self._save_lock:
+            if self._snapshot_pending:
+                self._write_snapshot()
+                self._snapshot_pending = False
+                return
+            with self._lock:
+                lines = [json.dumps([rel_path, self._files[rel_path]['size'], first_block,
+                                     self._files[rel_path]['blocks'][first_block:]]) + '\n'
+                         for rel_path, first_block in self._changed.items()]
+                self._changed.clear()
+            if not lines:
+                return
+            with open(self.journal_file, 'a') as f:
+                f.writelines(lines)
+                size = f.tell()
+            if size > self.journal_bytes:
+                self._write_snapshot()
+
+    # Adds blocks for records appended to a file since the previous update
+    def update_file(self, file_path):
+        rel_path = path.relpath(file_path, self.logs_dir)
+        with self._lock:
+            # the size is taken under the lock: a file is indexed by the background scan and by flushes
+            size = path.getsize(file_path)
+            entry = self._files.get(rel_path)
+            if entry is None or entry['size'] > size:  # new or rewritten file
+                entry = {'size': 0, 'blocks': []}
+                self._files[rel_path] = entry
+                self._changed[rel_path] = 0
+            if entry['size'] == size:
+                return
+            blocks = entry['blocks']
+            # the last block may be extended
+            self._changed[rel_path] = min(self._changed.get(rel_path, len(blocks)), max(len(blocks) - 1, 0))
+            if file_path.endswith('.bin'):
+                self._update_binary(file_path, entry, size)
+            else:
+                self._update_text(file_path, entry, size)
+
+    def _add_record(self, blocks, t, offset, length):
+        if blocks and blocks[-1][4] < self.block_records and blocks[-1][2] + blocks[-1][3] == offset:
+            block = blocks[-1]
+            block[1] = max(block[1], t)
+            block[0] = min(block[0], t)
+            block[3] += length
+            block[4] += 1
+        else:
+            blocks.append([t, t, offset, length, 1])
+
+    def _update_binary(self, file_path, entry, size):
+        with open(file_path, 'rb') as f:
+            columns, header_size = binary_log.decode_header(f)
+            record_size = 8 * len(columns)
+            start = max(entry['size'], header_size)
+            n_records = (size - start) // record_size
+            if n_records <= 0:
+                return
+            f.seek(start)
+            times = np.frombuffer(f.read(n_records * record_size), dtype='<f8')[::len(columns)]
+        blocks = entry['blocks']
+        for i, t in enumerate(times):
+            self._add_record(blocks, float(t), start + i * record_size, record_size)
+        entry['size'] = start + n_records * record_size
+
+    def _update_text(self, file_path, entry, size):
+        start = entry['size']
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(size - start)
+        end = data.rfind(b'\n') + 1  # index only complete lines
+        if end == 0:
+            return
+        day = _log_day(file_path)
+        blocks = entry['blocks']
+        prev_time = blocks[-1][1] if blocks else None
+        offset = start
+        for line in data[:end].splitlines(keepends=True):
+            times, _ = _parse_text_lines([line.decode(errors='replace')], day, prev_time)
+            if times:
+                prev_time = times[0]
+                self._add_record(blocks, times[0], offset, len(line))
+            offset += len(line)
+        entry['size'] = start + end
+
+    # Indexes new files and appended records of the whole tree and saves the index.
+    # Run in background at start: a large tree takes long, meanwhile flushed files are indexed as usual.
+    # Setting stop_event stops it, the rest is indexed next time
+    def update(self, stop_event=None):
+        if not path.isdir(self.logs_dir):
+            return
+        for day in sorted(os.listdir(self.logs_dir)):
+            day_dir = path.join(self.logs_dir, day)
+            if not path.isdir(day_dir):
+                continue
+            for file_name in sorted(os.listdir(day_dir)):
+                if stop_event is not None and stop_event.is_set():
+                    self.save()
+                    return
+                if file_name.endswith('.log') or file_name.endswith('.bin'):
+                    try:
+                        self.update_file(path.join(day_dir, file_name))
+                    except (OSError, ValueError) as e:
+                        print(f'Cannot index {file_name} of {day}:', e)
+            self.save()
+
+    # Blocks of a log (e.g. 'Temperature.log') overlapping [t_start, t_end): [(file path, block)]
+    def find_blocks(self, file_name, t_start, t_end):
+        found = []
+        with self._lock:
+            for rel_path in sorted(self._files):
+                if path.basename(rel_path) != file_name:
+                    continue
+                for block in self._files[rel_path]['blocks']:
+                    if block[1] >= t_start and block[0] < t_end:
+                        found.append((path.join(self.logs_dir, rel_path), list(block)))
+        return found
+
+    # Reads records of a log with t_start <= time < t_end.
+    # Returns (times, values): a 1D array of Unix times and a 2D array with one column per channel
+    def query(self, file_name, t_start, t_end):
+        times = []
+        values = []
+        for file_path, (t_first, t_last, offset, length, n_records) in self.find_blocks(file_name, t_start, t_end):
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+            if file_path.endswith('.bin'):
+                with open(file_path, 'rb') as f:
+                    columns, _ = binary_log.decode_header(f)
+                records = np.frombuffer(data, dtype='<f8').reshape(-1, len(columns))
+                block_times = records[:, 0]
+                block_values = records[:, 1:]
+            else:
+                # the record before a block is needed only to detect a midnight wrap, the block knows it
+                parsed_times, parsed_values = _parse_text_lines(data.decode(errors='replace').splitlines(),
+                                                                _log_day(file_path), t_first)
+                block_times = np.array(parsed_times, dtype=np.float64)
+                block_values = np.array(parsed_values, dtype=np.float64)
+            mask = (block_times >= t_start) & (block_times < t_end)
+            times.append(block_times[mask])
+            values.append(block_values[mask])
+        if len(times) == 0:
+            return np.zeros(0), np.zeros((0, 0))
+        return np.concatenate(times), np.concatenate(values)
@@ -0,0 +1,232 @@
+# A background log writer.
+# Records are put to a queue and written by a separate thread which keeps files open
+# and flushes them in batches: every flush_records records or every flush_interval seconds.
+# With a write-ahead spool (see spool.py) every record is first appended to a local spool, records
+# which failed to be written (e.g. Logs/ on a stalled share) are retried and survive a restart.
+import os
+import queue
+import threading
+import time
+
+from Storage.binary_log import BinaryLogWriter
+from Instrumentation.metrics import log_flushes
+
+# fsync policies
+FSYNC_NEVER = 'never'  # only flush Python buffers, OS decides when data reaches a disk
+FSYNC_BATCH = 'batch'  # fsync files after each batch flush
+FSYNC_ALWAYS = 'always'  # flush and fsync after every record
+
+
+class LogWriter:
+    # flush_records - flush after this number of records
+    # flush_interval - flush at least every flush_interval seconds (if there is something to flush)
+    # fsync - one of FSYNC_NEVER, FSYNC_BATCH, FSYNC_ALWAYS
+    # stop_event - threading.Event, the writer flushes all pending records and stops when it is set
+    # max_idle - close a file if nothing was written to it for max_idle seconds (e.g. yesterday's logs)
+    # on_flush - a function called (in the writer thread) with a list of flushed file paths, e.g. to update an index
+    # spool - WriteAheadSpool, records left in it by a previous run are written first
+    # max_retry_delay - maximal delay between attempts to write a record after an I/O error (s)
+    def __init__(self, flush_records=10, flush_interval=60, fsync=FSYNC_BATCH, stop_event=None, max_idle=3600,
+                 on_flush=None, spool=None, max_retry_delay=30):
+        if fsync not in (FSYNC_NEVER, FSYNC_BATCH, FSYNC_ALWAYS):
+            raise ValueError(f'Unknown fsync policy: {fsync}')
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_idle = max_idle
+        self.on_flush = on_flush
+        self.spool = spool
+        self.max_retry_delay = max_retry_delay
+        self._stop_event = stop_event if stop_event is not None else threading.Event()
+        self._queue = queue.Queue()
+        self._put_lock = threading.Lock()  # records are queued in the order of their spool positions
+        self._files = {}  # path: file object
+        self._last_used = {}  # path: time of last write
+        self._n_pending = 0
+        self._last_flush = time.monotonic()
+        self._written_position = None  # a spool position of the last written record
+        self._unflushed = []  # records written since the last successful flush
+        self._failed = False  # stopped on an I/O error
+        if spool is not None:
+            replayed = spool.replay()
+            if replayed:
+                print(f'Writing {len(replayed)} log records left from the previous run')
+            for (file_path, line), position in replayed:
+                self._queue.put((file_path, tuple(line) if isinstance(line, list) else line, position))
+        self._thread = threading.Thread(target=self._thread_proc, name='log_writer')
+        self._thread.start()
+
+    # Called by acquisition loops, the logging task and the main thread at exit. Spool positions must
+    # increase in the queue order: a commit after a written record covers all records before it in the spool
+    def _put(self, file_path, line):
+        with self._put_lock:
+            position = None
+            if self.spool is not None:
+                try:
+                    position = self.spool.append((file_path, line))
+                except OSError as e:
+                    print('Error while writing log spool:', e)
+            self._queue.put((file_path, line, position))
+
+    # Queues a line to be appended to a text file (a line must end with '\n')
+    def write(self, file_path, line):
+        self._put(file_path, line)
+
+    # Queues a record to be appended to a binary log (see binary_log), values in the order of channels
+    def write_record(self, file_path, channels, timestamp, values):
+        self._put(file_path, (tuple(channels), timestamp, tuple(None if v is None else float(v) for v in values)))
+
+    # Opens a file, creating its directory (e.g. a new day directory) here in the writer thread
+    def _get_file(self, file_path, channels=None):
+        f = self._files.get(file_path)
+        if f is None:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if channels is None:
+                f = open(file_path, 'a')
+            else:
+                f = BinaryLogWriter(file_path, channels)
+            self._files[file_path] = f
+        self._last_used[file_path] = time.monotonic()
+        return f
+
+    def _flush(self):
+        try:
+            with log_flushes.time():
+                for f in self._files.values():
+                    f.flush()
+                    if self.fsync != FSYNC_NEVER:
+                        os.fsync(f.fileno())
+        except OSError:
+            self._drop_files()  # buffered data of a failed flush is written again from self._unflushed
+            raise
+        self._n_pending = 0
+        self._last_flush = time.monotonic()
+        self._unflushed = []
+        if self.spool is not None and self._written_position is not None:
+            try:
+                self.spool.commit(self._written_position)
+            except OSError as e:
+                print('Error while writing log spool:', e)
+            self._written_position = None
+        if self.on_flush is not None and self._files:
+            try:
+                self.on_flush(list(self._files))
+            except Exception as e:
+                print('Error in log flush handler:', e)
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for file_path in [p for p, t in self._last_used.items() if now - t > self.max_idle]:
+            self._files.pop(file_path).close()
+            del self._last_used[file_path]
+
+    # Closes all files without flushing, after an I/O error their handles may be broken
+    def _drop_files(self):
+        for f in self._files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._files = {}
+        self._last_used = {}
+
+    def _write_record(self, file_path, line, position=None):
+        self._unflushed.append((file_path, line, position))
+        try:
+            if isinstance(line, tuple):
+                channels, timestamp, values = line
+                f = self._get_file(file_path, channels)
+                f.append(timestamp, values)
+            else:
+                f = self._get_file(file_path)
+                f.write(line)
+            if self.fsync == FSYNC_ALWAYS:
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            self._drop_files()
+            raise
+        self._n_pending += 1
+        if position is not None:
+            self._written_position = position
+
+    # Writes again all records since the last successful flush after an I/O error, with a growing delay,
+    # until it succeeds. Without a spool the records are dropped. Returns False if the writer was stopped
+    # meanwhile: the records stay in the spool and are written at the next start
+    def _recover(self):
+        if self.spool is None:
+            self._drop_files()
+            self._unflushed = []
+            self._n_pending = 0
+            return True
+        delay = 0.5
+        while not self._stop_event.wait(delay):
+            records, self._unflushed = self._unflushed, []
+            self._n_pending = 0
+            try:
+                for record in records:
+                    self._write_record(*record)
+                self._flush()
+                return True
+            except OSError as e:
+                print('Error while writing logs:', e)
+                self._unflushed = records  # records of the failed attempt are kept once
+                delay = min(delay * 2, self.max_retry_delay)
+        return False
+
+    def _thread_proc(self):
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - self._last_flush), 0.01)
+            try:
+                file_path, line, position = self._queue.get(timeout=min(timeout, 0.5))
+            except queue.Empty:
+                file_path = None
+
+            try:
+                if file_path is not None:
+                    self._write_record(file_path, line, position)
+                if self._n_pending >= self.flush_records or \
+                        (self._n_pending > 0 and time.monotonic() - self._last_flush >= self.flush_interval):
+                    self._flush()
+                    self._close_idle()
+            except OSError as e:
+                print('Error while writing logs:', e)
+                if not self._recover():
+                    self._failed = True  # stopped while storage is failing, the rest is in the spool
+                    break
+            except Exception as e:  # a record which can never be written, e.g. channels of a binary log differ
+                print(f'Dropping a log record for {file_path}:', e)
+                if file_path is not None:
+                    self._unflushed.pop()
+
+            if self._stop_event.is_set() and self._queue.empty():
+                break
+
+        self._close_files()
+
+    def _close_files(self):
+        if self._failed:
+            self._drop_files()
+            return
+        try:
+            self._flush()
+        except OSError as e:
+            print('Error while writing logs:', e)
+        self._drop_files()
+
+    # Writes all pending records and stops the writer thread.
+    # Records queued after the thread has stopped are written here as well,
+    # unless the writer has stopped on an I/O error: then they are left in the spool
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+        if not self._failed:
+            try:
+                while not self._queue.empty():
+                    self._write_record(*self._queue.get_nowait())
+            except OSError as e:
+                print('Error while writing logs:', e)
+                self._failed = self.spool is not None
+        self._close_files()
+        if self.spool is not None:
+            self.spool.close()
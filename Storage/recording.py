@@ -0,0 +1,109 @@
+# Recording policies deciding which samples of a stream are written to disk.
+# All samples are kept in memory anyway (ring buffers), a policy only thins the logs:
+#   RECORD_INTERVAL - the latest sample every log_period seconds (the classic behaviour)
+#   RECORD_ALL - every sample
+#   RECORD_DEADBAND - swinging door compression: a sample is written only when a straight line from the
+#       previously written one cannot represent the samples in between within a per-channel deviation,
+#       plus a heartbeat record at least every `heartbeat` seconds. Linear interpolation between written
+#       records then reproduces every sample within the deviation: full resolution during transients
+#       and a record per heartbeat at a stable base temperature.
+import math
+
+RECORD_INTERVAL = 'interval'
+RECORD_ALL = 'all'
+RECORD_DEADBAND = 'deadband'
+RECORDING_MODES = (RECORD_INTERVAL, RECORD_ALL, RECORD_DEADBAND)
+
+
+# Writes every sample
+class AllRecorder:
+    # Returns a list of (timestamp, values) records to write
+    def add(self, timestamp, values):
+        return [(timestamp, values)]
+
+    def flush(self):
+        return []
+
+
+# Swinging door compression of records of several channels. A record is written when any channel needs it,
+# then doors of all channels are restarted from it, so the error bound holds for every channel.
+class DeadbandRecorder:
+    # deviations - maximal reconstruction error of every channel, heartbeat - maximal time between records (s)
+    def __init__(self, deviations, heartbeat=300.0):
+        self.deviations = tuple(deviations)
+        self.heartbeat = heartbeat
+        self._archived = None  # the last written (timestamp, values)
+        self._held = None  # the last sample, not written yet
+        n = len(self.deviations)
+        self._upper = [math.inf] * n  # the narrowest door slopes so far
+        self._lower = [-math.inf] * n
+
+    def _restart(self, record):
+        self._archived = record
+        self._held = None
+        n = len(self.deviations)
+        self._upper = [math.inf] * n
+        self._lower = [-math.inf] * n
+
+    # A sample fits if a line from the written record to it passes within deviations of all samples between.
+    # Then doors are narrowed by the sample, returns False (doors unchanged) if it does not fit.
+    def _fit(self, timestamp, values):
+        t0, values0 = self._archived
+        dt = timestamp - t0
+        if dt <= 0:  # a clock step back, nothing can be interpolated over it
+            return False
+        for v, v0, l, u in zip(values, values0, self._lower, self._upper):
+            if not l <= (v - v0) / dt <= u:
+                return False
+        deviations = self.deviations
+        self._upper = [min(u, (v + d - v0) / dt) for u, v, d, v0 in zip(self._upper, values, deviations, values0)]
+        self._lower = [max(l, (v - d - v0) / dt) for l, v, d, v0 in zip(self._lower, values, deviations, values0)]
+        return True
+
+    # Returns a list of (timestamp, values) records to write
+    def add(self, timestamp, values):
+        record = (timestamp, tuple(values))
+        if self._archived is None:
+            self._restart(record)
+            return [record]
+
+        res = []
+        if not self._fit(timestamp, values):
+            if self._held is None:  # nothing between, write this sample
+                self._restart(record)
+                return [record]
+            res.append(self._held)
+            self._restart(self._held)
+            self._fit(timestamp, values)
+        self._held = record
+
+        if timestamp - self._archived[0] >= self.heartbeat:
+            res.append(record)
+            self._restart(record)
+        return res
+
+    # The last sample if it was not written, e.g. at exit
+    def flush(self):
+        if self._held is None:
+            return []
+        held = self._held
+        self._restart(held)
+        return [held]
+
+
+# Creates a recorder for a recording config {'mode': ..., 'deviation': ..., 'heartbeat': ...},
+# deviation is a number or {channel: number}. Returns None for RECORD_INTERVAL.
+def make_recorder(config, channels):
+    mode = config['mode']
+    if mode == RECORD_INTERVAL:
+        return None
+    if mode == RECORD_ALL:
+        return AllRecorder()
+    if mode == RECORD_DEADBAND:
+        deviation = config['deviation']
+        if isinstance(deviation, dict):
+            deviations = [deviation[chan] for chan in channels]
+        else:
+            deviations = [deviation] * len(channels)
+        return DeadbandRecorder(deviations, config['heartbeat'])
+    raise ValueError(f'Unknown recording mode: {mode}')
@@ -0,0 +1,87 @@
+# Multi-resolution rollups of a sample stream.
+# For every tier (e.g. 1 min, 10 min, 1 h buckets) min/max/mean/count of each channel is accumulated
+# and a finished bucket is passed to a sink, usually written as a binary log (see binary_log)
+# next to the raw logs. A month overview then needs only a few thousand rows.
+import math
+
+from Storage import binary_log
+
+# tier name: bucket width (s)
+DEFAULT_TIERS = (('1m', 60), ('10m', 600), ('1h', 3600))
+STATS = ('min', 'max', 'mean', 'count')
+
+
+# Column names of a rollup log for given channels: A_min, A_max, A_mean, A_count, B_min, ...
+def rollup_columns(channels):
+    return [f'{chan}_{stat}' for chan in channels for stat in STATS]
+
+
+# File name of a rollup log, e.g. Temperature_1m.bin for Temperature.bin
+def rollup_file_name(log_name, tier):
+    return f'{log_name}_{tier}.bin'
+
+
+class _Bucket:
+    def __init__(self, start, n_channels):
+        self.start = start
+        self.mins = [math.inf] * n_channels
+        self.maxs = [-math.inf] * n_channels
+        self.sums = [0.0] * n_channels
+        self.counts = [0] * n_channels
+
+    def add(self, values):
+        for i, v in enumerate(values):
+            if v is None or math.isnan(v):
+                continue
+            if v < self.mins[i]:
+                self.mins[i] = v
+            if v > self.maxs[i]:
+                self.maxs[i] = v
+            self.sums[i] += v
+            self.counts[i] += 1
+
+    # Values in the order of rollup_columns, NaN for channels without samples
+    def values(self):
+        res = []
+        for i, count in enumerate(self.counts):
+            if count == 0:
+                res += [math.nan, math.nan, math.nan, 0]
+            else:
+                res += [self.mins[i], self.maxs[i], self.sums[i] / count, count]
+        return res
+
+
+# Accumulates rollups of one stream
+# channels - channel names
+# sink(tier, bucket_start, values) - receives finished buckets, values in the order of rollup_columns(channels)
+# tiers - sequence of (tier name, bucket width in seconds)
+class RollupAggregator:
+    def __init__(self, channels, sink, tiers=DEFAULT_TIERS):
+        self.channels = tuple(channels)
+        self.columns = rollup_columns(self.channels)
+        self.tiers = tuple(tiers)
+        self._sink = sink
+        self._buckets = {}  # tier name: current _Bucket
+
+    def add(self, timestamp, values):
+        for tier, width in self.tiers:
+            start = math.floor(timestamp / width) * width
+            bucket = self._buckets.get(tier)
+            if bucket is None or bucket.start != start:
+                if bucket is not None:
+                    self._sink(tier, bucket.start, bucket.values())
+                bucket = _Bucket(start, len(self.channels))
+                self._buckets[tier] = bucket
+            bucket.add(values)
+
+    # Emits unfinished buckets (e.g. at exit). After a restart a bucket with the same start
+    # may appear again, readers should merge rows with equal timestamps
+    def flush(self):
+        for tier, bucket in self._buckets.items():
+            self._sink(tier, bucket.start, bucket.values())
+        self._buckets = {}
+
+
+# Reads rollups of a log (e.g. 'Temperature') for a time range, see binary_log.read_time_range
+def read_rollup(logs_dir, log_name, tier, t_start, t_end):
+    return binary_log.read_time_range(logs_dir, rollup_file_name(log_name, tier), t_start, t_end)
@@ -0,0 +1,133 @@
+# A crash-safe write-ahead spool of log records on a local disk.
+#
+# Every record is appended to a spool segment before it is queued for the log writer, so records not yet
+# written to the logs (e.g. Logs/ on a stalled network share, or the process was killed) are replayed
+# at the next start. A segment is a sequence of entries:
+#   <payload length: u32> <crc32 of payload: u32> <payload: JSON>
+# An entry is written by one os.write call, so a crash of the process loses nothing already appended;
+# a torn or corrupted tail (a power loss without fsync) is detected by the checksum and cut off.
+# The writer commits a position after records up to it were flushed to the logs; fully committed
+# segments are deleted. Delivery is at least once: records after the last commit may be written twice.
+import json
+import os
+import struct
+import threading
+import zlib
+from os import path
+
+_ENTRY_HEADER = struct.Struct('<II')
+_SEGMENT_SUFFIX = '.spool'
+CHECKPOINT_FILE_NAME = 'checkpoint'
+
+
+def _segment_name(segment_id):
+    return f'{segment_id:08d}{_SEGMENT_SUFFIX}'
+
+
+def encode_entry(item):
+    payload = json.dumps(item, separators=(',', ':')).encode()
+    return _ENTRY_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+# Reads valid entries of a segment from offset, returns [(item, end offset)] and an offset of the valid end
+def read_entries(file_path, offset=0):
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    res = []
+    while offset + _ENTRY_HEADER.size <= len(data):
+        length, crc = _ENTRY_HEADER.unpack_from(data, offset)
+        start = offset + _ENTRY_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        offset = start + length
+        res.append((json.loads(payload), offset))
+    return res, offset
+
+
+class WriteAheadSpool:
+    # spool_dir - a directory on a local disk
+    # segment_bytes - a new segment is started when the current one is larger
+    # fsync - fsync every entry (survives a power loss, costs a disk flush per record)
+    def __init__(self, spool_dir, segment_bytes=16 * 1024 * 1024, fsync=False):
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(spool_dir, exist_ok=True)
+        self._checkpoint = self._read_checkpoint()
+        segments = self._segments()
+        # every run appends to a new segment, after all existing ones and the checkpoint
+        self._segment_id = max(segments[-1] if segments else 0, self._checkpoint[0]) + 1
+        self._fd = None
+        self._size = 0
+
+    def _segments(self):
+        return sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.spool_dir)
+                      if name.endswith(_SEGMENT_SUFFIX))
+
+    def _segment_path(self, segment_id):
+        return path.join(self.spool_dir, _segment_name(segment_id))
+
+    def _read_checkpoint(self):
+        try:
+            with open(path.join(self.spool_dir, CHECKPOINT_FILE_NAME), 'r') as f:
+                segment_id, offset = (int(v) for v in f.read().split())
+            return segment_id, offset
+        except (OSError, ValueError):
+            return 0, 0
+
+    # Records not committed before, as [(item, position)]. Corrupted tails of segments are cut off.
+    # Called once at start, before appending
+    def replay(self):
+        res = []
+        checkpoint_id, checkpoint_offset = self._checkpoint
+        for segment_id in self._segments():
+            file_path = self._segment_path(segment_id)
+            if segment_id < checkpoint_id:
+                os.remove(file_path)
+                continue
+            entries, valid_end = read_entries(file_path)
+            if valid_end < path.getsize(file_path):
+                print(f'Spool segment {file_path} is damaged after {valid_end} bytes, the rest is dropped')
+                os.truncate(file_path, valid_end)
+            start = checkpoint_offset if segment_id == checkpoint_id else 0
+            res.extend((item, (segment_id, end)) for item, end in entries if end > start)
+        return res
+
+    # Appends a record (a JSON-serializable item), returns its position for commit()
+    def append(self, item):
+        entry = encode_entry(item)
+        with self._lock:
+            if self._fd is None or self._size >= self.segment_bytes:
+                self._open_segment()
+            os.write(self._fd, entry)
+            if self.fsync:
+                os.fsync(self._fd)
+            self._size += len(entry)
+            return self._segment_id, self._size
+
+    def _open_segment(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._segment_id += 1
+        self._fd = os.open(self._segment_path(self._segment_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+
+    # Marks records up to a position as written to the logs, deletes segments before it
+    def commit(self, position):
+        segment_id, offset = position
+        checkpoint_file = path.join(self.spool_dir, CHECKPOINT_FILE_NAME)
+        with open(checkpoint_file + '.tmp', 'w') as f:
+            f.write(f'{segment_id} {offset}')
+        os.replace(checkpoint_file + '.tmp', checkpoint_file)
+        for old_id in self._segments():
+            if old_id >= segment_id:
+                break
+            os.remove(self._segment_path(old_id))
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None